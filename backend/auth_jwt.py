@@ -0,0 +1,181 @@
+"""
+Verificación local de los JWT de Supabase Auth.
+
+Valida firma, expiración, audiencia y emisor sin llamar a Supabase:
+- HS256 con el secreto del proyecto (SUPABASE_JWT_SECRET)
+- RS256/ES256 con las llaves públicas del JWKS del proyecto, cacheadas y
+  refrescadas periódicamente
+
+Los tokens ya verificados se guardan unos segundos en memoria. Si el token
+viene firmado con una llave desconocida se lanza UnknownKeyError para que
+el llamador recurra a la verificación remota.
+"""
+
+import hashlib
+import json
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import jwt
+
+
+class UnknownKeyError(Exception):
+    """El token está firmado con una llave que no se puede verificar localmente"""
+
+
+def user_from_claims(claims):
+    """Objeto con los mismos atributos que usan los endpoints de supabase.auth.get_user().user"""
+    return SimpleNamespace(
+        id=claims.get('sub'),
+        email=claims.get('email'),
+        phone=claims.get('phone'),
+        role=claims.get('role'),
+        user_metadata=claims.get('user_metadata') or {},
+        app_metadata=claims.get('app_metadata') or {},
+    )
+
+
+class SupabaseTokenVerifier:
+
+    def __init__(self, supabase_url=None, jwt_secret=None, api_key=None, audience='authenticated',
+                 jwks_refresh_seconds=600, cache_ttl_seconds=60, cache_max_entries=10000,
+                 leeway_seconds=5):
+        base_url = (supabase_url or '').rstrip('/')
+        self.issuer = f"{base_url}/auth/v1" if base_url else None
+        self.jwks_url = f"{self.issuer}/.well-known/jwks.json" if base_url else None
+        self.jwt_secret = jwt_secret
+        self.api_key = api_key
+        self.audience = audience
+        self.jwks_refresh_seconds = jwks_refresh_seconds
+        self.cache_ttl_seconds = cache_ttl_seconds
+        self.cache_max_entries = cache_max_entries
+        self.leeway_seconds = leeway_seconds
+
+        self._keys = {}
+        self._keys_fetched_at = 0.0
+        self._keys_lock = threading.Lock()
+        self._verified = OrderedDict()
+        self._verified_lock = threading.Lock()
+        self._stats = {
+            'cache_hits': 0,
+            'local_verifications': 0,
+            'rejections': 0,
+            'unknown_keys': 0,
+            'jwks_refreshes': 0,
+            'jwks_errors': 0,
+        }
+
+    @property
+    def enabled(self):
+        return bool(self.jwt_secret or self.jwks_url)
+
+    def verify(self, token):
+        """
+        Retorna los claims del token si es válido.
+        Lanza jwt.InvalidTokenError si es inválido o expiró y
+        UnknownKeyError si no se puede verificar localmente.
+        """
+        cache_key = hashlib.sha256(token.encode('utf-8')).hexdigest()
+        now = time.time()
+
+        with self._verified_lock:
+            entry = self._verified.get(cache_key)
+            if entry is not None:
+                claims, valid_until = entry
+                if now < valid_until:
+                    self._verified.move_to_end(cache_key)
+                    self._stats['cache_hits'] += 1
+                    return claims
+                del self._verified[cache_key]
+
+        try:
+            header = jwt.get_unverified_header(token)
+            algorithm = header.get('alg')
+            key = self._key_for(algorithm, header.get('kid'))
+            claims = jwt.decode(
+                token,
+                key=key,
+                algorithms=[algorithm],
+                audience=self.audience,
+                issuer=self.issuer,
+                leeway=self.leeway_seconds,
+                options={'require': ['exp', 'sub']},
+            )
+        except UnknownKeyError:
+            self._record('unknown_keys')
+            raise
+        except jwt.InvalidTokenError:
+            self._record('rejections')
+            raise
+
+        valid_until = min(now + self.cache_ttl_seconds, claims['exp'])
+        with self._verified_lock:
+            self._stats['local_verifications'] += 1
+            self._verified[cache_key] = (claims, valid_until)
+            while len(self._verified) > self.cache_max_entries:
+                self._verified.popitem(last=False)
+        return claims
+
+    def forget(self, token):
+        """Elimina un token del caché (por ejemplo al cerrar sesión)"""
+        cache_key = hashlib.sha256(token.encode('utf-8')).hexdigest()
+        with self._verified_lock:
+            self._verified.pop(cache_key, None)
+
+    def stats(self):
+        with self._verified_lock:
+            stats = dict(self._stats)
+            stats['cached_tokens'] = len(self._verified)
+        with self._keys_lock:
+            stats['jwks_keys'] = len(self._keys)
+        return stats
+
+    def _record(self, key):
+        with self._verified_lock:
+            self._stats[key] += 1
+
+    def _key_for(self, algorithm, kid):
+        if algorithm == 'HS256':
+            if not self.jwt_secret:
+                raise UnknownKeyError('SUPABASE_JWT_SECRET no configurado')
+            return self.jwt_secret
+
+        if algorithm not in ('RS256', 'ES256') or not self.jwks_url:
+            raise UnknownKeyError(f'Algoritmo no soportado localmente: {algorithm}')
+
+        with self._keys_lock:
+            stale = time.time() - self._keys_fetched_at > self.jwks_refresh_seconds
+            if stale or (kid not in self._keys and self._can_force_refresh()):
+                self._refresh_keys()
+            key = self._keys.get(kid)
+        if key is None:
+            raise UnknownKeyError(f'Llave desconocida: {kid}')
+        return key
+
+    def _can_force_refresh(self):
+        # Ante un kid desconocido se refresca el JWKS, como mucho cada 30 s
+        return time.time() - self._keys_fetched_at > 30
+
+    def _refresh_keys(self):
+        """Descarga el JWKS. Se llama con _keys_lock tomado."""
+        self._keys_fetched_at = time.time()
+        headers = {'apikey': self.api_key} if self.api_key else {}
+        try:
+            request = urllib.request.Request(self.jwks_url, headers=headers)
+            with urllib.request.urlopen(request, timeout=5) as response:
+                jwks = json.loads(response.read().decode('utf-8'))
+            keys = {}
+            for jwk in jwks.get('keys', []):
+                try:
+                    keys[jwk.get('kid')] = jwt.PyJWK(jwk).key
+                except jwt.PyJWTError as e:
+                    print(f"Llave JWKS ignorada ({jwk.get('kid')}): {e}")
+            self._keys = keys
+            self._stats['jwks_refreshes'] += 1
+        except Exception as e:
+            # Se conservan las llaves anteriores hasta el próximo intento
+            self._stats['jwks_errors'] += 1
+            print(f"Error descargando JWKS: {e}")
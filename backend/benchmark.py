@@ -0,0 +1,659 @@
+"""
+Benchmark offline del pipeline de /search.
+
+Reemplaza las dependencias externas de main.py por dobles en memoria:
+- FakeLLMClient: respuestas JSON predefinidas según el tipo de prompt, con
+  latencia log-normal configurable (mediana y dispersión) y errores opcionales
+- SQLiteDatabase: SQLite en memoria con el esquema de components,
+  search_history, search_history_counts, result_blobs e idempotency_keys;
+  traduce el SQL de MySQL que usa main.py (placeholders, NOW(), DATE_ADD,
+  TIMESTAMPDIFF, ON DUPLICATE KEY UPDATE) y sus errores a main.Error
+- FakeSupabase: tablas en memoria con la API encadenada que usa main.py
+
+y mide process_keywords y la ruta Flask /search con distintos niveles de
+concurrencia: p50/p95/p99, throughput y número de llamadas a cada dependencia.
+
+Uso:
+    python benchmark.py --target both --concurrency 1,8,32 --requests 64
+    python benchmark.py --llm-latency-ms 1200 --llm-sigma 0.4 --json
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import math
+import os
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+KEYWORD_INPUTS = [
+    "comida criolla, pollo a la brasa, delivery",
+    "tecnología financiera pagos digitales",
+    "ropa deportiva; zapatillas; running",
+    "restaurantes de comida criolla en Lima",
+    "software contable para pymes",
+    "cafetería de especialidad, café orgánico",
+    "innovación sostenibilidad energía solar",
+    "educación online cursos de programación",
+    "clínica dental ortodoncia blanqueamiento",
+    "logística última milla, envíos express",
+]
+SECTORS = ["Alimentos", "Tecnología", "Retail", "Salud", "Educación"]
+COUNTRIES = ["Perú", "Chile", "México"]
+
+
+def percentile(values, p):
+    """Percentil por rango más cercano"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, math.ceil(p / 100 * len(ordered)) - 1)
+    return ordered[rank]
+
+
+# ==================== LLM FALSO ====================
+class FakeLLMClient:
+    """Imita client.chat.completions.create de OpenAI con respuestas predefinidas"""
+
+    def __init__(self, median_ms=800, sigma=0.35, error_rate=0.0, seed=1):
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.seed = seed
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = Counter()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def reset(self):
+        """Contadores en cero y misma secuencia de latencias y errores en cada corrida"""
+        with self._lock:
+            self.calls.clear()
+            self._random.seed(self.seed)
+
+    def create(self, model, messages, max_tokens=None, temperature=None, **kwargs):
+        prompt = messages[-1]['content']
+        kind, reply = self._reply(prompt)
+        with self._lock:
+            self.calls[kind] += 1
+            latency = self._random.lognormvariate(math.log(max(self.median_ms, 1) / 1000), self.sigma)
+            fail = self._random.random() < self.error_rate
+        time.sleep(latency)
+        if fail:
+            raise RuntimeError(f"Error simulado de DeepSeek ({kind})")
+
+        content = json.dumps(reply, ensure_ascii=False)
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = len(content) // 4
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens
+            )
+        )
+
+    def _reply(self, prompt):
+        if 'Palabras clave ya registradas:' in prompt:
+            candidates = re.search(r'Palabras clave ya registradas: (.*)', prompt).group(1).split(', ')
+            by_key = {main.normalize_keyword(c): c for c in candidates}
+            keywords = main.split_keywords_locally(self._input(prompt))
+            return 'analyze_and_match', {'keywords': [
+                {'keyword': k, 'matched_word': by_key.get(main.normalize_keyword(k))} for k in keywords
+            ]}
+        if '{"keywords": ["palabra1"' in prompt:
+            return 'analyze', {'keywords': main.split_keywords_locally(self._input(prompt))}
+        if 'para cada una de las siguientes palabras clave' in prompt:
+            block = prompt.split('palabras clave:', 1)[1].split('Contexto común', 1)[0]
+            keywords = [line[2:].strip() for line in block.splitlines() if line.startswith('- ')]
+            return 'research_batch', {'results': [self._component(k) for k in keywords]}
+        if '- Palabra clave:' in prompt:
+            keyword = re.search(r'- Palabra clave: (.*)', prompt).group(1).strip()
+            return 'research', self._component(keyword)
+        if 'análisis consolidado' in prompt:
+            return 'final_analysis', {
+                'summary': 'Resumen generado por el benchmark',
+                'key_findings': ['hallazgo 1', 'hallazgo 2'],
+                'recommendations': ['recomendación 1'],
+                'overall_score': 70
+            }
+        return 'unknown', {}
+
+    @staticmethod
+    def _input(prompt):
+        return re.search(r'Input: "(.*)"', prompt).group(1)
+
+    @staticmethod
+    def _component(keyword):
+        score = int(hashlib.md5(keyword.encode('utf-8')).hexdigest(), 16) % 60 + 40
+        return {'keyword': keyword, 'description': f'Empresas relacionadas con {keyword}', 'relevance_score': score}
+
+
+# ==================== BD EN MEMORIA ====================
+SQLITE_SCHEMA = """
+CREATE TABLE components (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    keyword TEXT NOT NULL,
+    keyword_key TEXT,
+    sector TEXT NOT NULL DEFAULT '',
+    country TEXT NOT NULL DEFAULT '',
+    campo1 TEXT, campo2 TEXT, campo3 INTEGER, campo4 TEXT,
+    refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (keyword, sector, country)
+);
+CREATE INDEX idx_keyword_key ON components (keyword_key, sector, country);
+CREATE TABLE search_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT,
+    company_name TEXT NOT NULL,
+    country TEXT, sector TEXT,
+    keywords TEXT, results TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX idx_created_at ON search_history (created_at);
+CREATE INDEX idx_user_created ON search_history (user_id, created_at, id);
+CREATE TABLE result_blobs (
+    hash TEXT NOT NULL PRIMARY KEY,
+    kind TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE search_history_counts (
+    user_id TEXT NOT NULL,
+    dimension TEXT NOT NULL,
+    value TEXT NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, dimension, value)
+);
+CREATE TABLE idempotency_keys (
+    idempotency_key TEXT NOT NULL PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    response TEXT,
+    expires_at TIMESTAMP NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+# Columnas de la clave única de cada tabla (destino de ON CONFLICT)
+CONFLICT_TARGETS = {
+    'components': 'keyword, sector, country',
+    'search_history_counts': 'user_id, dimension, value',
+    'result_blobs': 'hash',
+    'idempotency_keys': 'idempotency_key',
+}
+
+
+def translate_mysql(sql):
+    """Traduce a SQLite las construcciones de MySQL que usa main.py"""
+    sql = sql.replace('%s', '?')
+    sql = re.sub(
+        r'TIMESTAMPDIFF\(SECOND, (\w+), NOW\(\)\)',
+        r"(CAST(strftime('%s', 'now') AS INTEGER) - CAST(strftime('%s', \1) AS INTEGER))",
+        sql
+    )
+    sql = re.sub(
+        r'DATE_ADD\(NOW\(\), INTERVAL (\?|\d+) SECOND\)',
+        r"datetime('now', '+' || \1 || ' seconds')",
+        sql
+    )
+    sql = sql.replace('NOW()', 'CURRENT_TIMESTAMP')
+    if 'ON DUPLICATE KEY UPDATE' in sql:
+        table = re.search(r'INSERT INTO (\w+)', sql).group(1)
+        sql = sql.replace('ON DUPLICATE KEY UPDATE', f'ON CONFLICT ({CONFLICT_TARGETS[table]}) DO UPDATE SET')
+        sql = re.sub(r'VALUES\((\w+)\)', r'excluded.\1', sql)
+    return sql
+
+
+class SQLiteDatabase:
+    """
+    Sustituto del pool de mysql-connector: una sola conexión SQLite en memoria
+    serializada con un lock, con latencia simulada por sentencia
+    """
+
+    def __init__(self, latency_ms=2.0):
+        self.latency = latency_ms / 1000
+        self.statements = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._conn = sqlite3.connect(
+                ':memory:',
+                check_same_thread=False,
+                isolation_level=None,
+                detect_types=sqlite3.PARSE_DECLTYPES
+            )
+            self._conn.row_factory = sqlite3.Row
+            self._conn.executescript(SQLITE_SCHEMA)
+            self.statements = 0
+
+    def run(self, sql, params_list, many):
+        if self.latency:
+            time.sleep(self.latency)
+        sql = translate_mysql(sql)
+        with self._lock:
+            self.statements += 1
+            try:
+                if many:
+                    self._conn.executemany(sql, params_list)
+                    return []
+                return self._conn.execute(sql, params_list or ()).fetchall()
+            except sqlite3.Error as e:
+                # Los helpers de main.py capturan Error y revisan errno como con MySQL
+                error = main.Error(str(e))
+                error.errno = 1062 if isinstance(e, sqlite3.IntegrityError) else None
+                raise error from e
+
+    # Interfaz de pooling.MySQLConnectionPool
+    def get_connection(self):
+        return _Connection(self)
+
+
+class _Connection:
+
+    def __init__(self, db):
+        self.db = db
+
+    def cursor(self, dictionary=False):
+        return _Cursor(self.db, dictionary)
+
+    def ping(self, reconnect=True, attempts=1, delay=0):
+        pass
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class _Cursor:
+
+    def __init__(self, db, dictionary):
+        self.db = db
+        self.dictionary = dictionary
+        self._rows = []
+
+    def execute(self, sql, params=None):
+        self._rows = self.db.run(sql, params, many=False)
+
+    def executemany(self, sql, params_list):
+        self.db.run(sql, list(params_list), many=True)
+        self._rows = []
+
+    def fetchall(self):
+        if self.dictionary:
+            return [dict(row) for row in self._rows]
+        return [tuple(row) for row in self._rows]
+
+    def close(self):
+        pass
+
+
+# ==================== SUPABASE FALSO ====================
+class FakeSupabase:
+    """Tablas en memoria con la API encadenada de supabase-py que usa main.py"""
+
+    # Recursos embebidos en select('*, companies(...)') -> columna de la FK
+    EMBEDDED_KEYS = {'companies': 'company_id'}
+
+    def __init__(self, latency_ms=20.0):
+        self.latency = latency_ms / 1000
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self.auth = SimpleNamespace(get_user=self._get_user, sign_out=lambda: None)
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.tables = {'companies': [], 'user_profiles': []}
+            self._ids = itertools.count(1)
+            self.calls.clear()
+
+    def table(self, name):
+        return _SupabaseQuery(self, name)
+
+    def rpc(self, name, params):
+        return _SupabaseQuery(self, name, rpc_params=params)
+
+    def _get_user(self, token):
+        return SimpleNamespace(user=fake_user(token))
+
+    def execute(self, query):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls[f"{query.operation}:{query.name}"] += 1
+            if query.rpc_params is not None:
+                return SimpleNamespace(data=self._rpc(query.name, query.rpc_params))
+            rows = self.tables.setdefault(query.name, [])
+            return SimpleNamespace(data=getattr(self, f'_{query.operation}')(query, rows))
+
+    def _new_row(self, data):
+        row = {'id': next(self._ids), 'created_at': datetime.now(timezone.utc).isoformat()}
+        row.update(data)
+        return row
+
+    def _select(self, query, rows):
+        matched = [row for row in rows if query.matches(row)]
+        if query.order_by:
+            column, desc = query.order_by
+            matched.sort(key=lambda row: row.get(column) or '', reverse=desc)
+        if query.limit_to is not None:
+            matched = matched[:query.limit_to]
+        result = [self._embed(dict(row), query.columns) for row in matched]
+        if query.single_row:
+            return result[0] if result else None
+        return result
+
+    def _embed(self, row, columns):
+        for name, foreign_key in self.EMBEDDED_KEYS.items():
+            if f'{name}(' in columns:
+                related = [r for r in self.tables.get(name, []) if r['id'] == row.get(foreign_key)]
+                row[name] = related[0] if related else None
+        return row
+
+    def _insert(self, query, rows):
+        payload = query.payload if isinstance(query.payload, list) else [query.payload]
+        created = [self._new_row(data) for data in payload]
+        rows.extend(created)
+        return created
+
+    def _update(self, query, rows):
+        updated = []
+        for row in rows:
+            if query.matches(row):
+                row.update(query.payload)
+                updated.append(dict(row))
+        return updated
+
+    def _upsert(self, query, rows):
+        payload = query.payload if isinstance(query.payload, list) else [query.payload]
+        key = query.on_conflict or 'id'
+        result = []
+        for data in payload:
+            existing = next((row for row in rows if row.get(key) == data.get(key)), None)
+            if existing is None:
+                row = self._new_row(data)
+                rows.append(row)
+                result.append(row)
+            elif not query.ignore_duplicates:
+                existing.update(data)
+                result.append(dict(existing))
+        return result
+
+    def _rpc(self, name, params):
+        if name != 'create_company_and_link':
+            raise RuntimeError(f"RPC desconocida: {name}")
+        company = self._new_row({
+            'name': params['p_name'],
+            'country': params['p_country'],
+            'sector': params['p_sector'],
+            'keywords': params['p_keywords'],
+            'search_results': params['p_search_results'],
+            'analysis_key': params.get('p_analysis_key'),
+        })
+        self.tables['companies'].append(company)
+        for profile in self.tables['user_profiles']:
+            if profile['id'] == params['p_user_id']:
+                profile['company_id'] = company['id']
+        return company['id']
+
+
+class _SupabaseQuery:
+
+    def __init__(self, client, name, rpc_params=None):
+        self.client = client
+        self.name = name
+        self.rpc_params = rpc_params
+        self.operation = 'rpc' if rpc_params is not None else 'select'
+        self.columns = '*'
+        self.payload = None
+        self.filters = []
+        self.order_by = None
+        self.limit_to = None
+        self.single_row = False
+        self.on_conflict = None
+        self.ignore_duplicates = False
+
+    def select(self, columns='*'):
+        self.operation, self.columns = 'select', columns
+        return self
+
+    def insert(self, data):
+        self.operation, self.payload = 'insert', data
+        return self
+
+    def update(self, data):
+        self.operation, self.payload = 'update', data
+        return self
+
+    def upsert(self, data, on_conflict='', ignore_duplicates=False, **kwargs):
+        self.operation, self.payload = 'upsert', data
+        self.on_conflict, self.ignore_duplicates = on_conflict, ignore_duplicates
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def gte(self, column, value):
+        self.filters.append(lambda row: str(row.get(column) or '') >= str(value))
+        return self
+
+    def order(self, column, desc=False):
+        self.order_by = (column, desc)
+        return self
+
+    def limit(self, count):
+        self.limit_to = count
+        return self
+
+    def single(self):
+        self.single_row = True
+        return self
+
+    def matches(self, row):
+        return all(check(row) for check in self.filters)
+
+    def execute(self):
+        return self.client.execute(self)
+
+
+def fake_user(token):
+    """Usuario estable por token, con los atributos de user_from_claims"""
+    user_id = str(uuid.uuid5(uuid.NAMESPACE_URL, token))
+    return SimpleNamespace(
+        id=user_id,
+        email=f"{user_id[:8]}@benchmark.local",
+        phone=None,
+        role='authenticated',
+        user_metadata={'full_name': 'Benchmark'},
+        app_metadata={}
+    )
+
+
+# ==================== PREPARACIÓN ====================
+def load_main(args):
+    """Importa main.py con los dobles instalados y sin arrancar clientes reales"""
+    global main
+    os.environ.setdefault('DEEPSEEK_API_KEY', 'benchmark')
+    os.environ['WARM_UP_CLIENTS'] = '0'
+    os.environ.setdefault('LLM_REQUESTS_PER_MINUTE', '0')
+    os.environ.setdefault('LLM_CACHE_DIR', '')
+    os.environ.setdefault('WRITE_BEHIND_SPILL_DIR', tempfile.mkdtemp(prefix='bench_spill_'))
+    import main as main_module
+    main = main_module
+
+    llm = FakeLLMClient(args.llm_latency_ms, args.llm_sigma, args.llm_error_rate, args.seed)
+    db = SQLiteDatabase(args.db_latency_ms)
+    supabase = FakeSupabase(args.supabase_latency_ms)
+
+    main.get_llm_client = lambda: llm
+    main.get_db_pool = lambda: db
+    main.get_supabase = lambda: supabase
+    main.get_user_from_token = fake_user
+    return llm, db, supabase
+
+
+def reset_state(llm, db, supabase):
+    """
+    Cada corrida empieza desde el mismo estado: BD vacía, cachés limpias,
+    circuit breaker cerrado y gateway sin pausas ni reducción de ritmo
+    """
+    # Lo que quedó en la cola write-behind no debe escribirse en la BD nueva
+    main.write_queue.drain(timeout=30)
+    llm.reset()
+    db.reset()
+    main.llm_breaker.reset()
+    main.llm_gateway.reset()
+    supabase.reset()
+    for name in ('llm_response_cache', 'idempotent_responses', 'recent_searches',
+                 'recent_analyses', 'profile_cache'):
+        cache = getattr(main, name)
+        setattr(main, name, main.TTLCache(max_entries=cache.max_entries, ttl_seconds=cache.ttl_seconds))
+    main._keyword_indexes.clear()
+
+
+def make_request(i, repeat_companies):
+    company = f"Empresa {i % repeat_companies if repeat_companies else i}"
+    return {
+        'name': company,
+        'country': COUNTRIES[i % len(COUNTRIES)],
+        'sector': SECTORS[i % len(SECTORS)],
+        'keyword': KEYWORD_INPUTS[i % len(KEYWORD_INPUTS)],
+    }
+
+
+# ==================== EJECUCIÓN ====================
+def run_pipeline(data, index):
+    results = main.process_keywords(data['keyword'], data['sector'], data['country'])
+    return bool(results)
+
+
+def run_route(data, index):
+    token = f"bench-token-{index % 50}"
+    response = main.app.test_client().post(
+        '/search', json=data, headers={'Authorization': f'Bearer {token}'}
+    )
+    return response.status_code == 200
+
+
+def run_level(target, concurrency, args, llm, db, supabase):
+    reset_state(llm, db, supabase)
+    runner = run_pipeline if target == 'pipeline' else run_route
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(i):
+        nonlocal errors
+        data = make_request(i, args.repeat_companies)
+        started = time.perf_counter()
+        try:
+            ok = runner(data, i)
+        except Exception as e:
+            print(f"Error en la petición {i}: {e}", file=sys.stderr)
+            ok = False
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            errors += 0 if ok else 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(args.requests)))
+    wall = time.perf_counter() - started
+    # Las escrituras diferidas de esta corrida cuentan en db_statements
+    main.write_queue.drain(timeout=30)
+
+    return {
+        'target': target,
+        'concurrency': concurrency,
+        'requests': args.requests,
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 1) if latencies else 0.0,
+        'throughput_rps': round(args.requests / wall, 2) if wall else 0.0,
+        'llm_calls': dict(llm.calls),
+        'llm_calls_total': sum(llm.calls.values()),
+        'db_statements': db.statements,
+        'supabase_calls': dict(supabase.calls),
+    }
+
+
+def print_table(results):
+    header = f"{'target':<9}{'conc':>5}{'req':>6}{'err':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>9}{'llm':>6}{'db':>6}{'supa':>6}"
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        print(
+            f"{r['target']:<9}{r['concurrency']:>5}{r['requests']:>6}{r['errors']:>5}"
+            f"{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}{r['throughput_rps']:>9}"
+            f"{r['llm_calls_total']:>6}{r['db_statements']:>6}{sum(r['supabase_calls'].values()):>6}"
+        )
+    print()
+    for r in results:
+        calls = ', '.join(f"{kind}={count}" for kind, count in sorted(r['llm_calls'].items()))
+        print(f"{r['target']} x{r['concurrency']} llamadas LLM: {calls or '-'}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark offline del pipeline de /search')
+    parser.add_argument('--target', choices=['pipeline', 'route', 'both'], default='both')
+    parser.add_argument('--concurrency', default='1,4,16', help='niveles separados por coma')
+    parser.add_argument('--requests', type=int, default=40, help='peticiones por nivel')
+    parser.add_argument('--repeat-companies', type=int, default=0,
+                        help='reutilizar N nombres de empresa (0 = todos distintos)')
+    parser.add_argument('--llm-latency-ms', type=float, default=800, help='mediana de latencia del LLM')
+    parser.add_argument('--llm-sigma', type=float, default=0.35, help='dispersión log-normal de la latencia')
+    parser.add_argument('--llm-error-rate', type=float, default=0.0)
+    parser.add_argument('--db-latency-ms', type=float, default=2.0)
+    parser.add_argument('--supabase-latency-ms', type=float, default=20.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help='salida en JSON')
+    return parser.parse_args(argv)
+
+
+def main_cli(argv=None):
+    args = parse_args(argv)
+    llm, db, supabase = load_main(args)
+    targets = ['pipeline', 'route'] if args.target == 'both' else [args.target]
+    levels = [int(level) for level in args.concurrency.split(',') if level.strip()]
+
+    results = [
+        run_level(target, concurrency, args, llm, db, supabase)
+        for target in targets
+        for concurrency in levels
+    ]
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+    else:
+        print_table(results)
+
+
+main = None
+
+if __name__ == '__main__':
+    main_cli()
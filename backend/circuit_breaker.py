@@ -0,0 +1,163 @@
+"""
+Circuit breaker para dependencias externas (DeepSeek).
+
+Registra el resultado de las últimas llamadas y abre el circuito cuando la
+tasa de errores o de llamadas lentas supera el umbral. Mientras está
+abierto las llamadas fallan al instante con CircuitOpenError, sin ocupar
+el worker esperando al timeout. Pasado open_seconds se deja pasar unas
+pocas llamadas de prueba (half-open): si salen bien se cierra, si alguna
+falla se vuelve a abrir.
+"""
+
+import threading
+import time
+from collections import deque
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """El circuito está abierto: la llamada no se hizo"""
+
+
+class CircuitBreaker:
+
+    def __init__(self, name='circuit', window_size=20, min_calls=5, failure_rate=0.5,
+                 slow_call_seconds=20.0, slow_call_rate=0.5, open_seconds=30.0,
+                 half_open_calls=2, is_failure=None):
+        self.name = name
+        self.window_size = window_size
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        # Qué excepciones cuentan como fallo de la dependencia (por defecto todas)
+        self.is_failure = is_failure or (lambda error: True)
+
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._outcomes = deque(maxlen=window_size)  # (falló, lenta)
+        self._trials = 0
+        self._trial_successes = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            'calls': 0,
+            'failures': 0,
+            'slow_calls': 0,
+            'rejected': 0,
+            'opened': 0,
+        }
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def check(self):
+        """Lanza CircuitOpenError si el circuito no dejaría pasar una llamada"""
+        with self._lock:
+            if not self._can_pass(time.monotonic()):
+                self._stats['rejected'] += 1
+                raise CircuitOpenError(f"{self.name}: circuito abierto")
+
+    def call(self, fn, *args, **kwargs):
+        """Ejecuta fn(*args, **kwargs) si el circuito lo permite y registra el resultado"""
+        with self._lock:
+            now = time.monotonic()
+            if not self._can_pass(now):
+                self._stats['rejected'] += 1
+                raise CircuitOpenError(f"{self.name}: circuito abierto")
+            trial = self._current_state(now) == HALF_OPEN
+            if trial:
+                self._trials += 1
+            self._stats['calls'] += 1
+
+        started = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self._record(trial, self.is_failure(e), time.monotonic() - started)
+            raise
+        self._record(trial, False, time.monotonic() - started)
+        return result
+
+    def reset(self):
+        """Vuelve al estado inicial: circuito cerrado, ventana y contadores vacíos"""
+        with self._lock:
+            self._state = CLOSED
+            self._opened_at = 0.0
+            self._outcomes.clear()
+            self._trials = 0
+            self._trial_successes = 0
+            for key in self._stats:
+                self._stats[key] = 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['state'] = self._current_state(time.monotonic())
+            stats['window_calls'] = len(self._outcomes)
+            stats['window_failures'] = sum(1 for failed, _ in self._outcomes if failed)
+            stats['window_slow'] = sum(1 for _, slow in self._outcomes if slow)
+        return stats
+
+    # ---------- estado (con _lock tomado) ----------
+    def _current_state(self, now):
+        if self._state == OPEN and now - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._trials = 0
+            self._trial_successes = 0
+        return self._state
+
+    def _can_pass(self, now):
+        state = self._current_state(now)
+        if state == OPEN:
+            return False
+        if state == HALF_OPEN:
+            return self._trials < self.half_open_calls
+        return True
+
+    def _open(self, now):
+        self._state = OPEN
+        self._opened_at = now
+        self._outcomes.clear()
+        self._stats['opened'] += 1
+        print(f"[{self.name}] Circuito abierto por {self.open_seconds}s")
+
+    def _record(self, trial, failed, duration):
+        slow = duration >= self.slow_call_seconds
+        with self._lock:
+            now = time.monotonic()
+            if failed:
+                self._stats['failures'] += 1
+            if slow:
+                self._stats['slow_calls'] += 1
+
+            if trial:
+                if self._state != HALF_OPEN:
+                    return
+                if failed or slow:
+                    self._open(now)
+                    return
+                self._trial_successes += 1
+                if self._trial_successes >= self.half_open_calls:
+                    self._state = CLOSED
+                    self._outcomes.clear()
+                    print(f"[{self.name}] Circuito cerrado")
+                return
+
+            # Llamadas que empezaron antes de abrirse el circuito no cuentan
+            if self._state != CLOSED:
+                return
+            self._outcomes.append((failed, slow))
+            calls = len(self._outcomes)
+            if calls < self.min_calls:
+                return
+            failures = sum(1 for f, _ in self._outcomes if f)
+            slow_calls = sum(1 for _, s in self._outcomes if s)
+            if failures / calls >= self.failure_rate or slow_calls / calls >= self.slow_call_rate:
+                self._open(now)
@@ -0,0 +1,39 @@
+"""
+Configuración de gunicorn.
+
+SERVER_MODE=sync (por defecto): workers síncronos, un /search por hilo.
+SERVER_MODE=async: workers gevent. Las llamadas bloqueantes de red
+(DeepSeek vía httpx, Supabase, MySQL en modo puro Python, JWKS) ceden el
+control mientras esperan, así que cada proceso atiende cientos de /search
+en curso con las mismas rutas y la misma autenticación. Las llamadas a
+DeepSeek y las conexiones a MySQL siguen acotadas por proceso; main.py sube
+sus valores por defecto en este modo (LLM_MAX_WORKERS, DB_POOL_SIZE).
+"""
+
+import os
+
+SERVER_MODE = os.getenv('SERVER_MODE', 'sync').lower()
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+workers = int(os.getenv('GUNICORN_WORKERS', '2'))
+
+# Los límites del gateway de DeepSeek (LLM_REQUESTS_PER_MINUTE y
+# LLM_TOKENS_PER_MINUTE) son por proceso. Si se define el presupuesto de la
+# cuenta, se reparte entre los workers, que heredan el entorno del maestro
+for account_var, worker_var in (
+    ('LLM_ACCOUNT_REQUESTS_PER_MINUTE', 'LLM_REQUESTS_PER_MINUTE'),
+    ('LLM_ACCOUNT_TOKENS_PER_MINUTE', 'LLM_TOKENS_PER_MINUTE'),
+):
+    account_budget = int(os.getenv(account_var, '0'))
+    if account_budget > 0:
+        os.environ[worker_var] = str(max(1, account_budget // max(1, workers)))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+accesslog = '-'
+errorlog = '-'
+
+if SERVER_MODE == 'async':
+    worker_class = 'gevent'
+    # Peticiones simultáneas (greenlets) por worker
+    worker_connections = int(os.getenv('GEVENT_WORKER_CONNECTIONS', '500'))
+else:
+    threads = int(os.getenv('GUNICORN_THREADS', '1'))
@@ -0,0 +1,146 @@
+"""
+Normalización e índice local de similitud para las keywords de la tabla components.
+
+normalize_keyword() genera la clave de búsqueda (components.keyword_key) y
+KeywordIndex compara palabras con coseno sobre n-gramas de caracteres (con
+acentos plegados), de modo que la mayoría de verificaciones de sinónimos se
+resuelven en memoria sin llamar al LLM.
+"""
+
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from functools import lru_cache
+
+NGRAM_SIZE = 3
+_NON_WORD_RE = re.compile(r'[^a-z0-9]+')
+
+
+def fold_accents(text):
+    """Pasa a minúsculas y elimina tildes/diacríticos ("Tecnología" -> "tecnologia")"""
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def _light_stem(word):
+    """
+    Stemming ligero para español: quita el plural y la vocal final de género
+    ("tecnologías" -> "tecnologi", "ciudades" -> "ciudad", "luces" -> "luz",
+    "intereses" -> "inter", "taxis" -> "taxi"). El plural y el singular de
+    una palabra deben dar la misma raíz
+    """
+    if len(word) <= 3 or word.isdigit():
+        return word
+
+    if word.endswith('ces') and len(word) > 4 and word[-4] in 'aeiou':
+        # Singular en -z: "luces" -> "luz" ("dulces" sigue la regla general)
+        word = word[:-3] + 'z'
+    elif word.endswith('ses') and len(word) > 4:
+        # "clases" -> "clas"; si el singular termina en -s ("intereses" ->
+        # "interes", "paises" -> "pais") se le aplica la regla del singular
+        word = word[:-2]
+        if word[-2:] in ('es', 'is', 'us'):
+            return _light_stem(word)
+    elif word.endswith('es') and len(word) > 4 and word[-3] in 'dlnrjz':
+        word = word[:-2]
+    elif word[-2:] in ('as', 'es', 'os', 'is', 'us'):
+        word = word[:-1]
+
+    if len(word) > 4 and word[-1] in 'aoe':
+        word = word[:-1]
+    return word
+
+
+@lru_cache(maxsize=8192)
+def normalize_keyword(text):
+    """
+    Clave de búsqueda de una keyword: acentos plegados, puntuación y
+    espacios colapsados y stemming ligero por palabra
+    ("Tecnologías " -> "tecnologi", "Comida,  criolla" -> "comid crioll")
+    """
+    words = _NON_WORD_RE.sub(' ', fold_accents(text or '')).split()
+    return ' '.join(_light_stem(word) for word in words)
+
+
+def normalize_context(value):
+    """Normaliza sector/país para usarlos como parte de la clave de un componente"""
+    return ' '.join(fold_accents(value or '').split())
+
+
+def char_ngrams(text, n=NGRAM_SIZE):
+    """N-gramas de caracteres con relleno en los bordes de cada palabra"""
+    grams = Counter()
+    for word in fold_accents(text).split():
+        padded = f" {word} "
+        if len(padded) <= n:
+            grams[padded] += 1
+            continue
+        for i in range(len(padded) - n + 1):
+            grams[padded[i:i + n]] += 1
+    return grams
+
+
+class KeywordIndex:
+    """
+    Índice invertido n-grama -> keywords, con vectores normalizados para
+    calcular el coseno solo contra las keywords que comparten algún n-grama.
+    """
+
+    def __init__(self, keywords=None):
+        self._vectors = {}
+        self._norms = {}
+        self._postings = defaultdict(set)
+        self._lock = threading.Lock()
+        if keywords:
+            self.update(keywords)
+
+    def __len__(self):
+        return len(self._vectors)
+
+    def __contains__(self, keyword):
+        return keyword in self._vectors
+
+    def add(self, keyword):
+        """Agrega una keyword al índice (idempotente)"""
+        with self._lock:
+            self._add_unlocked(keyword)
+
+    def update(self, keywords):
+        """Agrega las keywords que aún no estén indexadas"""
+        with self._lock:
+            for keyword in keywords:
+                self._add_unlocked(keyword)
+
+    def _add_unlocked(self, keyword):
+        if not keyword or keyword in self._vectors:
+            return
+        vector = char_ngrams(keyword)
+        self._vectors[keyword] = vector
+        self._norms[keyword] = math.sqrt(sum(v * v for v in vector.values()))
+        for gram in vector:
+            self._postings[gram].add(keyword)
+
+    def search(self, word, top_k=5):
+        """
+        Retorna las top_k keywords más parecidas a `word`
+        como lista de tuplas (keyword, score) ordenada de mayor a menor.
+        """
+        query = char_ngrams(word)
+        query_norm = math.sqrt(sum(v * v for v in query.values()))
+        if not query_norm:
+            return []
+
+        with self._lock:
+            dots = Counter()
+            for gram, weight in query.items():
+                for keyword in self._postings.get(gram, ()):
+                    dots[keyword] += weight * self._vectors[keyword][gram]
+            scored = [
+                (keyword, dot / (query_norm * self._norms[keyword]))
+                for keyword, dot in dots.items()
+            ]
+
+        scored.sort(key=lambda item: (-item[1], item[0]))
+        return scored[:top_k]
@@ -0,0 +1,180 @@
+"""
+Caché de respuestas del LLM con TTL.
+
+Primer nivel: LRU en memoria con tamaño máximo.
+Segundo nivel (opcional): archivos JSON en un directorio, para que las
+respuestas sobrevivan a reinicios y se compartan entre workers.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_text(text):
+    """Minúsculas y espacios colapsados, para que entradas equivalentes compartan clave"""
+    return _WHITESPACE_RE.sub(' ', str(text or '')).strip().lower()
+
+
+def make_cache_key(namespace, *parts):
+    """Clave estable a partir de las entradas del prompt (cualquier valor serializable a JSON)"""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    digest = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    return f"{namespace}:{digest}"
+
+
+class TTLCache:
+    """
+    LRU en memoria con expiración por TTL y un nivel persistente opcional.
+    Los valores se guardan serializados en JSON, así cada get() retorna
+    una copia independiente.
+    """
+
+    def __init__(self, max_entries=512, ttl_seconds=3600, persist_dir=None, max_persisted=5000):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_persisted = max_persisted
+        self.persist_dir = Path(persist_dir) if persist_dir else None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_cleanup = 0
+        self._stats = {
+            'hits': 0,
+            'persistent_hits': 0,
+            'misses': 0,
+            'sets': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0,
+        }
+
+        if self.persist_dir:
+            try:
+                self.persist_dir.mkdir(parents=True, exist_ok=True)
+            except OSError as e:
+                print(f"Caché persistente deshabilitada ({self.persist_dir}): {e}")
+                self.persist_dir = None
+
+    def get(self, key):
+        """Retorna el valor cacheado o None si no existe o expiró"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, payload = entry
+                if now - stored_at <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return json.loads(payload)
+                del self._entries[key]
+                self._stats['expirations'] += 1
+
+        entry = self._read_persisted(key, now)
+        with self._lock:
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._stats['persistent_hits'] += 1
+            self._store(key, *entry)
+        return json.loads(entry[1])
+
+    def set(self, key, value):
+        """Guarda un valor serializable a JSON"""
+        stored_at = time.time()
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._stats['sets'] += 1
+            self._store(key, stored_at, payload)
+        self._write_persisted(key, stored_at, payload)
+
+    def delete(self, key):
+        """Elimina una entrada (invalidación explícita)"""
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._stats['invalidations'] += 1
+        if self.persist_dir:
+            try:
+                self._path_for(key).unlink()
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['hits'] + stats['persistent_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['hits'] + stats['persistent_hits']) / lookups, 4) if lookups else 0.0
+        stats['max_entries'] = self.max_entries
+        stats['ttl_seconds'] = self.ttl_seconds
+        stats['persistent'] = self.persist_dir is not None
+        return stats
+
+    def _store(self, key, stored_at, payload):
+        self._entries[key] = (stored_at, payload)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    # ---------- nivel persistente ----------
+    def _path_for(self, key):
+        return self.persist_dir / f"{hashlib.sha256(key.encode('utf-8')).hexdigest()}.json"
+
+    def _read_persisted(self, key, now):
+        if not self.persist_dir:
+            return None
+        path = self._path_for(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        stored_at = data.get('stored_at', 0)
+        if now - stored_at > self.ttl_seconds:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+            return None
+        return stored_at, data.get('payload')
+
+    def _write_persisted(self, key, stored_at, payload):
+        if not self.persist_dir:
+            return
+        path = self._path_for(key)
+        try:
+            # Escritura atómica: archivo temporal y luego rename
+            temp_path = path.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'stored_at': stored_at, 'payload': payload}, f, ensure_ascii=False)
+            temp_path.replace(path)
+            self._cleanup_persisted()
+        except OSError as e:
+            print(f"Error guardando caché persistente: {e}")
+
+    def _cleanup_persisted(self):
+        """Elimina los archivos más antiguos si se supera max_persisted"""
+        # Listar el directorio es caro: solo se revisa cada 100 escrituras
+        with self._lock:
+            self._writes_since_cleanup += 1
+            if self._writes_since_cleanup < 100:
+                return
+            self._writes_since_cleanup = 0
+
+        files = list(self.persist_dir.glob('*.json'))
+        if len(files) <= self.max_persisted:
+            return
+        files.sort(key=lambda f: f.stat().st_mtime)
+        for path in files[:-self.max_persisted]:
+            try:
+                path.unlink()
+            except OSError:
+                pass
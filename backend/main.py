@@ -1,15 +1,36 @@
-from flask import Flask, request, jsonify
-from flask_cors import CORS
 import os
 import json
-import mysql.connector
-from mysql.connector import Error
-from openai import OpenAI
-from decouple import config
-from dotenv import load_dotenv
-import psycopg2
-from supabase import create_client, Client
+import base64
+import hashlib
+import hmac
+import time
+import threading
+import sys
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from functools import wraps
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta, timezone
+from startup_timing import timed, mark_ready, report as startup_report, print_report
+
+# openai, supabase y mysql.connector se importan la primera vez que se usan
+# (get_llm_client, get_supabase, get_db_pool) para acelerar el arranque en frío
+with timed('flask'):
+    from flask import Flask, request, jsonify, Response, stream_with_context
+    from flask_cors import CORS
+with timed('dotenv'):
+    from dotenv import load_dotenv
+with timed('módulos locales'):
+    from keyword_index import KeywordIndex, normalize_keyword, normalize_context
+    from llm_cache import TTLCache, make_cache_key, normalize_text
+    from auth_jwt import SupabaseTokenVerifier, UnknownKeyError, user_from_claims
+    from write_behind import WriteBehindQueue
+    from request_dedup import SingleFlight
+    from llm_gateway import LLMGateway, BACKGROUND, is_rate_limit_error
+    from circuit_breaker import CircuitBreaker, CLOSED
+    from llm_accounting import LLMAccounting
+    import prompt_builder
+    from prompt_builder import clip_text, compact_json, fit_json_items
 
 load_dotenv()
 
@@ -17,25 +38,174 @@ app = Flask(__name__)
 CORS(app)
 
 # ==================== CONFIGURACIÓN SUPABASE ====================
-supabase: Client = None
-if os.getenv('SUPABASE_URL') and os.getenv('SUPABASE_KEY'):
-    try:
-        supabase = create_client(
-            os.getenv('SUPABASE_URL'),
-            os.getenv('SUPABASE_KEY')
-        )
-        print("Supabase client initialized")
-    except Exception as e:
-        print(f"Supabase initialization error: {e}")
+# El cliente se crea en el primer uso (get_supabase)
+_supabase = None
+_supabase_lock = threading.Lock()
+
+def get_supabase():
+    """Cliente de Supabase, creado la primera vez; None si no está configurado"""
+    global _supabase
+    if _supabase is None and os.getenv('SUPABASE_URL') and os.getenv('SUPABASE_KEY'):
+        with _supabase_lock:
+            if _supabase is None:
+                try:
+                    with timed('supabase', 'lazy'):
+                        from supabase import create_client
+                        _supabase = create_client(
+                            os.getenv('SUPABASE_URL'),
+                            os.getenv('SUPABASE_KEY')
+                        )
+                    print("Supabase client initialized")
+                except Exception as e:
+                    print(f"Supabase initialization error: {e}")
+    return _supabase
+
+# Verificación local de JWT: SUPABASE_JWT_SECRET (HS256) y/o el JWKS del proyecto
+token_verifier = SupabaseTokenVerifier(
+    supabase_url=os.getenv('SUPABASE_URL'),
+    jwt_secret=os.getenv('SUPABASE_JWT_SECRET'),
+    api_key=os.getenv('SUPABASE_KEY'),
+    jwks_refresh_seconds=int(os.getenv('JWKS_REFRESH_SECONDS', '600')),
+    cache_ttl_seconds=int(os.getenv('AUTH_TOKEN_CACHE_SECONDS', '60'))
+)
 
 
 # ==================== CONFIGURACIÓN ====================
-DEEPSEEK_API_KEY = os.getenv('DEEPSEEK_API_KEY', config('DEEPSEEK_API_KEY'))
-client = OpenAI(
-    api_key=DEEPSEEK_API_KEY,
-    base_url="https://api.deepseek.com"
+DEEPSEEK_API_KEY = os.getenv('DEEPSEEK_API_KEY')
+if not DEEPSEEK_API_KEY:
+    print("DEEPSEEK_API_KEY no configurada: /search responderá en modo degradado")
+
+# Modo del servidor (ver gunicorn.conf.py). En modo async cada worker gevent
+# mantiene cientos de /search en curso, así que los límites por proceso de
+# DeepSeek y del pool de BD parten de valores más altos (las variables de
+# entorno siguen teniendo prioridad)
+SERVER_MODE = os.getenv('SERVER_MODE', 'sync').lower()
+ASYNC_MODE = SERVER_MODE == 'async'
+
+_llm_client = None
+_llm_client_lock = threading.Lock()
+
+def get_llm_client():
+    """Cliente de DeepSeek (API compatible con OpenAI), creado la primera vez"""
+    global _llm_client
+    if _llm_client is None:
+        if not DEEPSEEK_API_KEY:
+            raise RuntimeError("DEEPSEEK_API_KEY no configurada")
+        with _llm_client_lock:
+            if _llm_client is None:
+                with timed('openai', 'lazy'):
+                    from openai import OpenAI
+                    _llm_client = OpenAI(
+                        api_key=DEEPSEEK_API_KEY,
+                        base_url="https://api.deepseek.com",
+                        max_retries=0,  # Los 429 los reintenta llm_gateway
+                        timeout=float(os.getenv('LLM_TIMEOUT_SECONDS', '60'))
+                    )
+    return _llm_client
+
+# Máximo de llamadas concurrentes a DeepSeek por proceso durante /search
+LLM_MAX_WORKERS = int(os.getenv('LLM_MAX_WORKERS', '50' if ASYNC_MODE else '5'))
+_llm_executor = ThreadPoolExecutor(max_workers=LLM_MAX_WORKERS, thread_name_prefix='llm')
+
+# Todas las llamadas a DeepSeek del proceso pasan por el gateway (límites por
+# minuto en 0 = sin límite). Cada worker de gunicorn tiene su propio gateway:
+# los límites son por proceso (gunicorn.conf.py reparte el de la cuenta)
+llm_gateway = LLMGateway(
+    name='deepseek',
+    requests_per_minute=int(os.getenv('LLM_REQUESTS_PER_MINUTE', '120')),
+    tokens_per_minute=int(os.getenv('LLM_TOKENS_PER_MINUTE', '0')),
+    max_concurrency=int(os.getenv('LLM_MAX_CONCURRENCY', str(LLM_MAX_WORKERS))),
+    max_wait_seconds=float(os.getenv('LLM_MAX_WAIT_SECONDS', '120')),
+    max_retries=int(os.getenv('LLM_MAX_RETRIES', '3'))
+)
+
+# Si DeepSeek falla o responde lento, el circuito se abre y las llamadas
+# fallan al instante; /search responde con lo que haya en BD (modo degradado)
+llm_breaker = CircuitBreaker(
+    name='deepseek',
+    window_size=int(os.getenv('LLM_BREAKER_WINDOW', '20')),
+    min_calls=int(os.getenv('LLM_BREAKER_MIN_CALLS', '5')),
+    failure_rate=float(os.getenv('LLM_BREAKER_FAILURE_RATE', '0.5')),
+    slow_call_seconds=float(os.getenv('LLM_BREAKER_SLOW_SECONDS', '20')),
+    slow_call_rate=float(os.getenv('LLM_BREAKER_SLOW_RATE', '0.5')),
+    open_seconds=float(os.getenv('LLM_BREAKER_OPEN_SECONDS', '30')),
+    # Los 429 los maneja el gateway; no indican que el servicio esté caído
+    is_failure=lambda error: not is_rate_limit_error(error)
 )
 
+# Tokens, latencia y costo estimado de cada llamada a DeepSeek por call site.
+# Precios en USD por millón de tokens (entrada con y sin caché de contexto, salida)
+llm_usage = LLMAccounting(
+    name='deepseek',
+    input_price_per_million=float(os.getenv('LLM_PRICE_INPUT_PER_MILLION', '0.28')),
+    cached_input_price_per_million=float(os.getenv('LLM_PRICE_CACHED_INPUT_PER_MILLION', '0.028')),
+    output_price_per_million=float(os.getenv('LLM_PRICE_OUTPUT_PER_MILLION', '0.42'))
+)
+
+# Presupuesto en tokens (estimados localmente) de las partes variables de los prompts
+PROMPT_BUDGET_USER_INPUT = int(os.getenv('PROMPT_BUDGET_USER_INPUT', '150'))  # input del usuario
+PROMPT_BUDGET_KEYWORD_RESULTS = int(os.getenv('PROMPT_BUDGET_KEYWORD_RESULTS', '1200'))  # resultados en el análisis final
+PROMPT_DESCRIPTION_TOKENS = int(os.getenv('PROMPT_DESCRIPTION_TOKENS', '80'))  # por descripción de keyword
+
+# Umbrales del índice local de sinónimos (coseno sobre n-gramas)
+SYNONYM_ACCEPT_SCORE = float(os.getenv('SYNONYM_ACCEPT_SCORE', '0.85'))  # >= : sinónimo sin LLM
+SYNONYM_MIN_SCORE = float(os.getenv('SYNONYM_MIN_SCORE', '0.3'))  # < : no es sinónimo, sin LLM
+SYNONYM_TOP_K = int(os.getenv('SYNONYM_TOP_K', '5'))  # candidatos enviados al LLM si es ambiguo
+FUSED_CANDIDATES = int(os.getenv('FUSED_CANDIDATES', '20'))  # componentes enviados al análisis fusionado
+
+# Caché de respuestas del LLM (LLM_CACHE_DIR habilita el nivel persistente)
+llm_response_cache = TTLCache(
+    max_entries=int(os.getenv('LLM_CACHE_MAX_ENTRIES', '512')),
+    ttl_seconds=int(os.getenv('LLM_CACHE_TTL_SECONDS', '86400')),
+    persist_dir=os.getenv('LLM_CACHE_DIR') or None,
+    max_persisted=int(os.getenv('LLM_CACHE_MAX_PERSISTED', '5000'))
+)
+
+# Frescura de los componentes: pasado el TTL se sirven igual y se refrescan en segundo plano
+COMPONENT_TTL_SECONDS = int(os.getenv('COMPONENT_TTL_HOURS', '168')) * 3600
+COMPONENT_REFRESH_WORKERS = int(os.getenv('COMPONENT_REFRESH_WORKERS', '2'))
+_refresh_executor = ThreadPoolExecutor(max_workers=COMPONENT_REFRESH_WORKERS, thread_name_prefix='refresh')
+
+# Keywords por prompt en la investigación en lote (search_many_with_ai)
+RESEARCH_BATCH_SIZE = int(os.getenv('RESEARCH_BATCH_SIZE', '8'))
+
+# Escrituras diferidas de /search (perfil del usuario e historial).
+# WRITE_BEHIND_SPILL_DIR guarda lo pendiente al apagar; en Cloud Run /tmp está
+# en memoria y se pierde con la instancia, así que solo es durable si apunta
+# a un volumen montado
+write_queue = WriteBehindQueue(
+    name='search-writes',
+    max_size=int(os.getenv('WRITE_BEHIND_MAX_SIZE', '1000')),
+    batch_size=int(os.getenv('WRITE_BEHIND_BATCH_SIZE', '50')),
+    flush_interval=float(os.getenv('WRITE_BEHIND_FLUSH_SECONDS', '0.5')),
+    max_retries=int(os.getenv('WRITE_BEHIND_MAX_RETRIES', '5')),
+    spill_dir=os.getenv('WRITE_BEHIND_SPILL_DIR', '/tmp/write_behind')
+)
+
+# Respuestas de /search guardadas para reintentos: con Idempotency-Key durante
+# IDEMPOTENCY_TTL_SECONDS (en MySQL, compartido entre workers e instancias) y,
+# sin ella, la misma búsqueda durante SEARCH_REPLAY_SECONDS (solo en el proceso).
+# Una clave reservada por una búsqueda que no terminó (proceso caído) se libera
+# a los IDEMPOTENCY_PENDING_SECONDS
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv('IDEMPOTENCY_TTL_SECONDS', '86400'))
+IDEMPOTENCY_PENDING_SECONDS = int(os.getenv('IDEMPOTENCY_PENDING_SECONDS', '300'))
+SEARCH_REPLAY_SECONDS = int(os.getenv('SEARCH_REPLAY_SECONDS', '30'))
+
+# Un análisis de la misma empresa/sector/país y el mismo input de keywords
+# hecho por cualquier usuario se reutiliza durante ANALYSIS_REUSE_HOURS
+# (0 desactiva la reutilización)
+ANALYSIS_REUSE_SECONDS = int(float(os.getenv('ANALYSIS_REUSE_HOURS', '24')) * 3600)
+
+# Perfiles de /auth/user en memoria del proceso. Un cambio de perfil solo
+# invalida la entrada del worker que lo atendió; los demás workers sirven el
+# perfil anterior hasta que vence, por eso el TTL es de pocos segundos
+PROFILE_CACHE_SECONDS = int(os.getenv('PROFILE_CACHE_SECONDS', '5'))
+profile_cache = TTLCache(max_entries=10000, ttl_seconds=PROFILE_CACHE_SECONDS)
+
+# Paginación de /results
+RESULTS_DEFAULT_LIMIT = int(os.getenv('RESULTS_DEFAULT_LIMIT', '20'))
+RESULTS_MAX_LIMIT = int(os.getenv('RESULTS_MAX_LIMIT', '100'))
+
 # ==================== DATABASE CONFIGURATION ====================
 # Use environment variables for database connection
 DB_CONFIG = {
@@ -45,16 +215,161 @@ DB_CONFIG = {
     'password': os.getenv('DB_PASSWORD', 'password')
 }
 
+# En modo async (workers gevent) el conector debe usar la implementación
+# pura en Python para que las esperas de MySQL cedan el control
+if ASYNC_MODE:
+    DB_CONFIG['use_pure'] = True
+
+# Pool de conexiones compartido por todos los helpers de BD. Si se agota el
+# timeout, las lecturas de componentes vuelven vacías y se investigan de nuevo
+DB_POOL_NAME = os.getenv('DB_POOL_NAME', 'search_pool')
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '32' if ASYNC_MODE else '5'))  # mysql-connector admite como máximo 32
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '15' if ASYNC_MODE else '5'))  # segundos esperando una conexión libre
+
 # ==================== CONEXIÓN BD ====================
+_db_pool = None
+_db_pool_lock = threading.Lock()
+_db_pool_slots = threading.BoundedSemaphore(DB_POOL_SIZE)
+_db_pool_stats = {
+    'checkouts': 0,
+    'checkout_failures': 0,
+    'checkout_timeouts': 0,
+    'health_check_failures': 0,
+    'in_use': 0,
+    'wait_time_ms_total': 0.0,
+}
+_db_pool_stats_lock = threading.Lock()
+
+def _record_pool_stat(key, amount=1):
+    with _db_pool_stats_lock:
+        _db_pool_stats[key] += amount
+
+# mysql.connector se importa al crear el pool. Hasta entonces Error es un
+# marcador que nunca se lanza (los `except Error` lo resuelven al fallar)
+class Error(Exception):
+    pass
+
+def _import_mysql():
+    global Error
+    with timed('mysql.connector', 'lazy'):
+        from mysql.connector import Error as MySQLError, pooling
+    Error = MySQLError
+    return pooling
+
+def get_db_pool():
+    """
+    Crea el pool de conexiones la primera vez que se necesita.
+    Si MySQL no está disponible se reintenta en la siguiente llamada.
+    """
+    global _db_pool
+    if _db_pool is None:
+        with _db_pool_lock:
+            if _db_pool is None:
+                pooling = _import_mysql()
+                try:
+                    _db_pool = pooling.MySQLConnectionPool(
+                        pool_name=DB_POOL_NAME,
+                        pool_size=DB_POOL_SIZE,
+                        pool_reset_session=True,
+                        **DB_CONFIG
+                    )
+                    print(f"Pool de BD inicializado ({DB_POOL_SIZE} conexiones)")
+                except Error as e:
+                    print(f"Error creando pool de BD: {e}")
+                    return None
+    return _db_pool
+
 def get_db_connection():
+    """
+    Obtiene una conexión del pool verificando que siga viva.
+    Bloquea hasta DB_POOL_TIMEOUT segundos si todas están en uso.
+    La conexión debe devolverse con release_db_connection().
+    """
+    pool = get_db_pool()
+    if pool is None:
+        _record_pool_stat('checkout_failures')
+        return None
+
+    started = time.perf_counter()
+    if not _db_pool_slots.acquire(timeout=DB_POOL_TIMEOUT):
+        _record_pool_stat('checkout_timeouts')
+        print("Error conectando a BD: pool agotado")
+        return None
+    _record_pool_stat('wait_time_ms_total', (time.perf_counter() - started) * 1000)
+
     try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        return conn
+        conn = pool.get_connection()
     except Error as e:
+        _db_pool_slots.release()
+        _record_pool_stat('checkout_failures')
         print(f"Error conectando a BD: {e}")
         return None
 
+    # Health check: reconecta si el servidor cerró la conexión inactiva
+    try:
+        conn.ping(reconnect=True, attempts=2, delay=0)
+    except Error as e:
+        _record_pool_stat('health_check_failures')
+        print(f"Conexión del pool no responde: {e}")
+        release_db_connection(conn, checked_out=False)
+        _db_pool_slots.release()
+        return None
+
+    _record_pool_stat('checkouts')
+    _record_pool_stat('in_use')
+    return conn
+
+def release_db_connection(conn, checked_out=True):
+    """Devuelve la conexión al pool"""
+    try:
+        conn.close()
+    except Error as e:
+        print(f"Error devolviendo conexión al pool: {e}")
+    if checked_out:
+        _record_pool_stat('in_use', -1)
+        _db_pool_slots.release()
+
+@contextmanager
+def db_connection():
+    """
+    Presta una conexión del pool durante el bloque `with`.
+    Produce None si la BD no está disponible.
+    """
+    conn = get_db_connection()
+    try:
+        yield conn
+    finally:
+        if conn is not None:
+            release_db_connection(conn)
+
+def get_db_pool_stats():
+    """Métricas del pool de conexiones"""
+    with _db_pool_stats_lock:
+        stats = dict(_db_pool_stats)
+    stats['pool_size'] = DB_POOL_SIZE
+    stats['initialized'] = _db_pool is not None
+    stats['avg_wait_time_ms'] = round(
+        stats['wait_time_ms_total'] / stats['checkouts'], 3
+    ) if stats['checkouts'] else 0.0
+    stats['wait_time_ms_total'] = round(stats['wait_time_ms_total'], 3)
+    return stats
+
 # ==================== MIDDLEWARE DE AUTENTICACIÓN ====================
+def get_user_from_token(token):
+    """
+    Verifica el token localmente (firma, expiración y audiencia) y solo
+    consulta a Supabase Auth si está firmado con una llave desconocida.
+    Retorna el usuario o None; lanza excepción si el token es inválido.
+    """
+    if token_verifier.enabled:
+        try:
+            return user_from_claims(token_verifier.verify(token))
+        except UnknownKeyError as e:
+            print(f"Verificación remota del token: {e}")
+    
+    user = get_supabase().auth.get_user(token)
+    return user.user if user else None
+
 def require_auth(f):
     """Decorador para proteger rutas que requieren autenticación"""
     @wraps(f)
@@ -67,12 +382,12 @@ def require_auth(f):
         token = auth_header.split(' ')[1]
         
         try:
-            user = supabase.auth.get_user(token)
+            user = get_user_from_token(token)
             
             if not user:
                 return jsonify({'error': 'Token inválido'}), 401
             
-            request.user = user.user
+            request.user = user
             
         except Exception as e:
             print(f"Error verificando token: {e}")
@@ -82,14 +397,62 @@ def require_auth(f):
     
     return decorated_function
 
+# /metrics expone costos y estado interno: solo responde con
+# Authorization: Bearer <METRICS_TOKEN>; sin token configurado está deshabilitado
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+def require_metrics_token(f):
+    """Decorador para las rutas internas de métricas"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not METRICS_TOKEN:
+            return jsonify({'error': 'Métricas deshabilitadas'}), 404
+        
+        auth_header = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(auth_header.encode('utf-8'), f'Bearer {METRICS_TOKEN}'.encode('utf-8')):
+            return jsonify({'error': 'Token de métricas inválido'}), 401
+        
+        return f(*args, **kwargs)
+    
+    return decorated_function
+
 # ==================== FUNCIONES DE IA ====================
+def chat_completion(prompt, max_tokens, temperature, call_site):
+    """
+    Llamada a DeepSeek a través del gateway (ritmo, concurrencia y prioridad)
+    y del circuit breaker. Con el circuito abierto lanza CircuitOpenError
+    sin esperar turno en el gateway.
+    call_site identifica la función que llama en la contabilidad (llm_usage);
+    la latencia registrada incluye la espera en el gateway
+    """
+    prompt_tokens = prompt_builder.record(call_site, prompt)
+    llm_breaker.check()
+    return llm_usage.track(
+        call_site,
+        llm_gateway.call,
+        llm_breaker.call,
+        get_llm_client().chat.completions.create,
+        model="deepseek-chat",
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=max_tokens,
+        temperature=temperature,
+        estimated_tokens=prompt_tokens + max_tokens
+    )
+
 def analyze_keywords_with_ai(keyword_input):
     """
     Analiza el input del usuario y descompone en palabras clave optimizadas
+    Las respuestas se cachean por input normalizado
     """
+    cache_key = make_cache_key('analyze_keywords', normalize_text(keyword_input))
+    cached = llm_response_cache.get(cache_key)
+    if cached is not None:
+        llm_usage.record_cache_hit('analyze_keywords_with_ai')
+        return cached
+    
     prompt = f"""Analiza el siguiente input del usuario y descompónlo en palabras clave concisas y optimizadas:
 
-Input: "{keyword_input}"
+Input: "{clip_text(keyword_input, PROMPT_BUDGET_USER_INPUT)}"
 
 Reglas:
 1. Descompón en palabras individuales (no oraciones)
@@ -101,12 +464,7 @@ Reglas:
 No agregues texto adicional, solo el JSON."""
 
     try:
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=500,
-            temperature=0.7
-        )
+        response = chat_completion(prompt, max_tokens=500, temperature=0, call_site='analyze_keywords_with_ai')
         
         response_text = response.choices[0].message.content.strip()
         # Limpia posibles markdown
@@ -116,30 +474,46 @@ No agregues texto adicional, solo el JSON."""
                 response_text = response_text[4:]
         
         result = json.loads(response_text)
-        return result.get('keywords', [])
+        keywords = result.get('keywords', [])
+        if keywords:
+            llm_response_cache.set(cache_key, keywords)
+        return keywords
     except Exception as e:
         print(f"Error en análisis de keywords: {e}")
         return []
 
-def check_synonym_with_ai(word, component_words):
+def analyze_and_match_keywords_with_ai(keyword_input, candidate_keywords):
     """
-    Verifica si una palabra es sinónima de alguna en la lista de componentes
+    Análisis fusionado: descompone el input en palabras clave optimizadas y,
+    en la misma llamada, las asocia a los componentes existentes que sean
+    sinónimos (candidate_keywords)
+    Retorna una lista de dicts {"keyword": ..., "matched_word": ... | None}
     """
-    prompt = f"""¿La palabra "{word}" es sinónima o muy similar a alguna de estas palabras?
-Lista: {', '.join(component_words)}
+    candidates = sorted(set(candidate_keywords))
+    cache_key = make_cache_key('analyze_and_match', normalize_text(keyword_input), candidates)
+    cached = llm_response_cache.get(cache_key)
+    if cached is not None:
+        llm_usage.record_cache_hit('analyze_and_match_keywords_with_ai')
+        return cached
+    
+    prompt = f"""Analiza el siguiente input del usuario y descompónlo en palabras clave concisas y optimizadas:
 
-Retorna SOLO un JSON con este formato exacto:
-{{"is_synonym": true/false, "matched_word": "palabra_coincidente_o_null"}}
+Input: "{clip_text(keyword_input, PROMPT_BUDGET_USER_INPUT)}"
 
-Si no hay sinónimo, matched_word debe ser null."""
+Palabras clave ya registradas: {', '.join(candidates)}
+
+Reglas:
+1. Descompón en palabras individuales (no oraciones)
+2. Elimina redundancias y sinónimos (elige la palabra con más impacto)
+3. Máximo 5 palabras clave
+4. Si una palabra clave es sinónima o muy similar a una de las ya registradas, indícala en "matched_word" (escrita exactamente como en la lista); si no, usa null
+5. Retorna SOLO un JSON con este formato exacto:
+{{"keywords": [{{"keyword": "palabra1", "matched_word": "registrada_o_null"}}]}}
+
+No agregues texto adicional, solo el JSON."""
 
     try:
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=300,
-            temperature=0.3
-        )
+        response = chat_completion(prompt, max_tokens=600, temperature=0, call_site='analyze_and_match_keywords_with_ai')
         
         response_text = response.choices[0].message.content.strip()
         if response_text.startswith('```'):
@@ -148,10 +522,97 @@ Si no hay sinónimo, matched_word debe ser null."""
                 response_text = response_text[4:]
         
         result = json.loads(response_text)
-        return result
+        candidate_set = set(candidates)
+        keywords = []
+        for item in result.get('keywords', []):
+            if isinstance(item, str):
+                item = {'keyword': item}
+            keyword = item.get('keyword')
+            if not keyword:
+                continue
+            # Solo se acepta un sinónimo que esté entre los candidatos
+            matched_word = (item.get('matched_word') or '').lower()
+            keywords.append({
+                'keyword': keyword,
+                'matched_word': matched_word if matched_word in candidate_set else None
+            })
+        if keywords:
+            llm_response_cache.set(cache_key, keywords)
+        return keywords
     except Exception as e:
-        print(f"Error verificando sinónimos: {e}")
+        print(f"Error en análisis fusionado de keywords: {e}")
+        return []
+
+# ==================== ÍNDICE LOCAL DE SINÓNIMOS ====================
+# Un índice por contexto (sector, país), con los contextos menos usados descartados
+KEYWORD_INDEX_MAX_CONTEXTS = int(os.getenv('KEYWORD_INDEX_MAX_CONTEXTS', '256'))
+_keyword_indexes = OrderedDict()
+_keyword_indexes_lock = threading.Lock()
+_synonym_stats = {'local_matches': 0, 'local_rejections': 0, 'fused_matches': 0}
+_synonym_stats_lock = threading.Lock()
+
+def _record_synonym_stat(key):
+    with _synonym_stats_lock:
+        _synonym_stats[key] += 1
+
+def get_keyword_index(sector, country, existing_keywords=()):
+    """
+    Retorna el índice local de keywords del contexto (sector, país),
+    agregando las que falten
+    """
+    context = (normalize_context(sector), normalize_context(country))
+    with _keyword_indexes_lock:
+        index = _keyword_indexes.get(context)
+        if index is None:
+            index = _keyword_indexes[context] = KeywordIndex()
+        _keyword_indexes.move_to_end(context)
+        while len(_keyword_indexes) > KEYWORD_INDEX_MAX_CONTEXTS:
+            _keyword_indexes.popitem(last=False)
+    index.update(existing_keywords)
+    return index
+
+def select_candidate_keywords(keyword_input, index, limit=FUSED_CANDIDATES):
+    """
+    Componentes más parecidos al input completo y a cada una de sus
+    palabras, para enviarlos al análisis fusionado
+    """
+    queries = [keyword_input] + keyword_input.replace(',', ' ').split()
+    best = {}
+    for query in queries:
+        for keyword, score in index.search(query, SYNONYM_TOP_K):
+            if score >= SYNONYM_MIN_SCORE and score > best.get(keyword, 0):
+                best[keyword] = score
+    ranked = sorted(best.items(), key=lambda item: (-item[1], item[0]))
+    return [keyword for keyword, _ in ranked[:limit]]
+
+def resolve_synonym(word, index):
+    """
+    Verifica sinónimos con el índice local. Solo se acepta una coincidencia
+    clara (SYNONYM_ACCEPT_SCORE); los casos ambiguos ya los resolvió el
+    análisis fusionado, así que aquí se tratan como "no es sinónimo"
+    """
+    matches = index.search(word, SYNONYM_TOP_K)
+    
+    if not matches or matches[0][1] < SYNONYM_MIN_SCORE:
+        _record_synonym_stat('local_rejections')
         return {"is_synonym": False, "matched_word": None}
+    
+    if matches[0][1] >= SYNONYM_ACCEPT_SCORE:
+        _record_synonym_stat('local_matches')
+        return {"is_synonym": True, "matched_word": matches[0][0]}
+    
+    _record_synonym_stat('local_rejections')
+    return {"is_synonym": False, "matched_word": None}
+
+def get_synonym_stats():
+    """Métricas del índice local de sinónimos"""
+    with _synonym_stats_lock:
+        stats = dict(_synonym_stats)
+    with _keyword_indexes_lock:
+        indexes = list(_keyword_indexes.values())
+    stats['indexed_contexts'] = len(indexes)
+    stats['indexed_keywords'] = sum(len(index) for index in indexes)
+    return stats
 
 def search_with_ai(keyword, sector, country):
     """
@@ -167,12 +628,7 @@ Retorna SOLO un JSON con este formato:
 {{"keyword": "{keyword}", "description": "descripción breve", "relevance_score": 0-100}}"""
 
     try:
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=800,
-            temperature=0.7
-        )
+        response = chat_completion(prompt, max_tokens=800, temperature=0.7, call_site='search_with_ai')
         
         response_text = response.choices[0].message.content.strip()
         if response_text.startswith('```'):
@@ -185,10 +641,90 @@ Retorna SOLO un JSON con este formato:
         print(f"Error en búsqueda con IA: {e}")
         return None
 
+def search_many_with_ai(keywords, sector, country):
+    """
+    Realiza la búsqueda con IA de varias palabras clave del mismo
+    sector y país en una sola llamada
+    Retorna un dict {keyword: resultado}; las keywords que el modelo
+    omita no aparecen en el dict
+    """
+    keyword_list = "\n".join(f"- {keyword}" for keyword in keywords)
+    prompt = f"""Busca información relevante sobre empresas para cada una de las siguientes palabras clave:
+{keyword_list}
+
+Contexto común:
+- Sector: {sector}
+- País: {country}
+
+Proporciona información general sobre empresas que coincidan con cada palabra clave en este contexto.
+Retorna SOLO un JSON con este formato, con exactamente un objeto por palabra clave y la palabra tal como aparece en la lista:
+{{"results": [{{"keyword": "palabra", "description": "descripción breve", "relevance_score": 0-100}}]}}"""
+
+    try:
+        response = chat_completion(
+            prompt,
+            max_tokens=min(400 + 300 * len(keywords), 4000),
+            temperature=0.7,
+            call_site='search_many_with_ai'
+        )
+        
+        response_text = response.choices[0].message.content.strip()
+        if response_text.startswith('```'):
+            response_text = response_text.split('```')[1]
+            if response_text.startswith('json'):
+                response_text = response_text[4:]
+        
+        items = json.loads(response_text).get('results', [])
+        by_key = {normalize_keyword(keyword): keyword for keyword in keywords}
+        results = {}
+        for item in items:
+            keyword = by_key.get(normalize_keyword(str(item.get('keyword', ''))))
+            if keyword and keyword not in results:
+                results[keyword] = item
+        return results
+    except Exception as e:
+        print(f"Error en búsqueda con IA (lote): {e}")
+        return {}
+
+def compact_keyword_results(keyword_results):
+    """
+    Resultados de keywords para el prompt del análisis final: solo keyword,
+    descripción (recortada) y puntaje, de mayor a menor relevancia para
+    que al aplicar el presupuesto se omitan los menos relevantes
+    """
+    compacted = []
+    for result in keyword_results:
+        data = result.get('data') or {}
+        entry = {'keyword': result['keyword']}
+        if data.get('description'):
+            entry['description'] = clip_text(str(data['description']), PROMPT_DESCRIPTION_TOKENS)
+        if isinstance(data.get('relevance_score'), (int, float)):
+            entry['relevance_score'] = data['relevance_score']
+        compacted.append(entry)
+    compacted.sort(key=lambda entry: -entry.get('relevance_score', 0))
+    return compacted
+
 def generate_final_results_with_ai(keyword_results, company_name, sector, country):
     """
     Genera resultados finales consolidados basados en todas las búsquedas
+    Las respuestas se cachean por empresa, sector, país y resultados
     """
+    cache_key = make_cache_key(
+        'final_results',
+        normalize_text(company_name),
+        normalize_text(sector),
+        normalize_text(country),
+        keyword_results
+    )
+    cached = llm_response_cache.get(cache_key)
+    if cached is not None:
+        llm_usage.record_cache_hit('generate_final_results_with_ai')
+        return cached
+    
+    prompt_results, omitted = fit_json_items(compact_keyword_results(keyword_results), PROMPT_BUDGET_KEYWORD_RESULTS)
+    if omitted:
+        print(f"Análisis final de {company_name}: {omitted} resultados omitidos por el presupuesto del prompt")
+    
     prompt = f"""Basándote en los siguientes resultados de búsqueda de palabras clave, 
 genera un análisis consolidado para la empresa:
 
@@ -197,7 +733,7 @@ Sector: {sector}
 País: {country}
 
 Resultados de palabras clave:
-{json.dumps(keyword_results, indent=2)}
+{compact_json(prompt_results)}
 
 Genera un análisis general y recomendaciones. Retorna SOLO un JSON con este formato:
 {{
@@ -208,12 +744,7 @@ Genera un análisis general y recomendaciones. Retorna SOLO un JSON con este for
 }}"""
 
     try:
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=1500,
-            temperature=0.7
-        )
+        response = chat_completion(prompt, max_tokens=1500, temperature=0.7, call_site='generate_final_results_with_ai')
         
         response_text = response.choices[0].message.content.strip()
         if response_text.startswith('```'):
@@ -221,179 +752,1087 @@ Genera un análisis general y recomendaciones. Retorna SOLO un JSON con este for
             if response_text.startswith('json'):
                 response_text = response_text[4:]
         
-        return json.loads(response_text)
+        final_results = json.loads(response_text)
+        llm_response_cache.set(cache_key, final_results)
+        return final_results
     except Exception as e:
         print(f"Error generando resultados finales: {e}")
         return None
 
 # ==================== FUNCIONES DE BD ====================
-def get_component_from_db(keyword):
+# Los componentes se guardan por (keyword_key, sector, país): el resultado de
+# search_with_ai depende del contexto, así que solo se reutiliza dentro de él.
+def get_component_from_db(keyword, sector='', country=''):
     """
     Busca una palabra clave en la tabla de componentes
     """
-    conn = get_db_connection()
-    if not conn:
-        return None
-    
-    try:
-        cursor = conn.cursor(dictionary=True)
-        query = "SELECT * FROM components WHERE keyword = %s"
-        cursor.execute(query, (keyword.lower(),))
-        result = cursor.fetchone()
-        return result
-    except Error as e:
-        print(f"Error consultando BD: {e}")
-        return None
-    finally:
-        cursor.close()
-        conn.close()
+    return get_components_from_db([keyword], sector, country).get(normalize_keyword(keyword))
 
-def get_all_component_keywords():
+def get_components_from_db(keywords, sector='', country=''):
     """
-    Obtiene todas las palabras clave registradas en componentes
+    Busca varias palabras clave del mismo contexto en una sola consulta
+    sobre la clave normalizada (WHERE keyword_key IN (...))
+    Retorna un dict {keyword_key: fila}; si varias filas comparten clave
+    se conserva la más antigua. Cada fila incluye age_seconds (tiempo
+    desde el último refresco)
     """
-    conn = get_db_connection()
-    if not conn:
-        return []
+    keys = list(dict.fromkeys(normalize_keyword(k) for k in keywords if k))
+    keys = [key for key in keys if key]
+    if not keys:
+        return {}
     
-    try:
-        cursor = conn.cursor()
-        query = "SELECT keyword FROM components"
-        cursor.execute(query)
-        results = cursor.fetchall()
-        return [row[0] for row in results]
-    except Error as e:
-        print(f"Error consultando BD: {e}")
-        return []
-    finally:
-        cursor.close()
-        conn.close()
+    with db_connection() as conn:
+        if not conn:
+            return {}
+        
+        cursor = None
+        try:
+            cursor = conn.cursor(dictionary=True)
+            placeholders = ', '.join(['%s'] * len(keys))
+            query = f"""SELECT *, TIMESTAMPDIFF(SECOND, refreshed_at, NOW()) AS age_seconds
+                        FROM components
+                        WHERE keyword_key IN ({placeholders}) AND sector = %s AND country = %s
+                        ORDER BY id"""
+            cursor.execute(query, (*keys, normalize_context(sector), normalize_context(country)))
+            components = {}
+            for row in cursor.fetchall():
+                components.setdefault(row['keyword_key'], row)
+            return components
+        except Error as e:
+            print(f"Error consultando BD: {e}")
+            return {}
+        finally:
+            if cursor:
+                cursor.close()
 
-def save_component_to_db(keyword, result_data):
+def get_all_component_keywords(sector='', country=''):
+    """
+    Obtiene todas las palabras clave registradas en componentes para un contexto
+    """
+    with db_connection() as conn:
+        if not conn:
+            return []
+        
+        cursor = None
+        try:
+            cursor = conn.cursor()
+            query = "SELECT keyword FROM components WHERE sector = %s AND country = %s"
+            cursor.execute(query, (normalize_context(sector), normalize_context(country)))
+            results = cursor.fetchall()
+            return [row[0] for row in results]
+        except Error as e:
+            print(f"Error consultando BD: {e}")
+            return []
+        finally:
+            if cursor:
+                cursor.close()
+
+def save_component_to_db(keyword, result_data, sector='', country=''):
     """
     Guarda un nuevo componente en la BD
     Estructura flexible: keyword, campo1, campo2, campo3, campo4
     """
-    conn = get_db_connection()
-    if not conn:
-        return False
+    return save_components_to_db([(keyword, result_data)], sector, country)
+
+def save_components_to_db(components, sector='', country=''):
+    """
+    Guarda varios componentes de un mismo contexto con un único
+    INSERT multi-fila (upsert) y marca refreshed_at
+    components: lista de tuplas (keyword, result_data)
+    """
+    if not components:
+        return True
     
-    try:
-        cursor = conn.cursor()
-        query = """INSERT INTO components 
-                   (keyword, campo1, campo2, campo3, campo4) 
-                   VALUES (%s, %s, %s, %s, %s)"""
-        
-        # Ajusta según los campos que decidas usar
-        values = (
-            keyword.lower(),
-            json.dumps(result_data),  # campo1: resultado completo
-            result_data.get('description', ''),  # campo2: descripción
-            result_data.get('relevance_score', 0),  # campo3: score
-            None  # campo4: por definir
-        )
+    with db_connection() as conn:
+        if not conn:
+            return False
         
-        cursor.execute(query, values)
-        conn.commit()
-        return True
-    except Error as e:
-        print(f"Error guardando en BD: {e}")
-        return False
-    finally:
-        cursor.close()
-        conn.close()
+        cursor = None
+        try:
+            cursor = conn.cursor()
+            query = """INSERT INTO components 
+                       (keyword, keyword_key, sector, country, campo1, campo2, campo3, campo4, refreshed_at) 
+                       VALUES (%s, %s, %s, %s, %s, %s, %s, %s, NOW())
+                       ON DUPLICATE KEY UPDATE
+                           keyword_key = VALUES(keyword_key),
+                           campo1 = VALUES(campo1),
+                           campo2 = VALUES(campo2),
+                           campo3 = VALUES(campo3),
+                           refreshed_at = NOW()"""
+            
+            # Ajusta según los campos que decidas usar
+            values = [
+                (
+                    keyword.lower(),
+                    normalize_keyword(keyword),  # clave de búsqueda
+                    normalize_context(sector),
+                    normalize_context(country),
+                    json.dumps(result_data),  # campo1: resultado completo
+                    result_data.get('description', ''),  # campo2: descripción
+                    result_data.get('relevance_score', 0),  # campo3: score
+                    None  # campo4: por definir
+                )
+                for keyword, result_data in components
+            ]
+            
+            # executemany agrupa los VALUES en una sola sentencia INSERT
+            cursor.executemany(query, values)
+            conn.commit()
+            return True
+        except Error as e:
+            print(f"Error guardando en BD: {e}")
+            return False
+        finally:
+            if cursor:
+                cursor.close()
 
-def save_search_history(company_name, country, sector, keywords, results):
+# Blobs del historial: search_history.results guarda la respuesta de /search
+# con los payloads que se repiten entre búsquedas (el `data` de cada keyword,
+# que es el componente, y el `final_analysis`) reemplazados por
+# {"$blob": hash}. El contenido se guarda una sola vez en result_blobs, con
+# el sha256 de su JSON canónico como clave.
+BLOB_REF = '$blob'
+
+def is_blob_ref(value):
+    return isinstance(value, dict) and len(value) == 1 and BLOB_REF in value
+
+def split_result_blobs(results):
     """
-    Guarda el historial de búsqueda
+    Separa los payloads de una respuesta de /search.
+    Retorna (respuesta con referencias, {hash: (tipo, JSON canónico)})
     """
-    conn = get_db_connection()
-    if not conn:
-        return False
+    blobs = {}
+    if not isinstance(results, dict):
+        return results, blobs
     
-    try:
-        cursor = conn.cursor()
-        query = """INSERT INTO search_history 
-                   (company_name, country, sector, keywords, results, created_at) 
-                   VALUES (%s, %s, %s, %s, %s, NOW())"""
-        
-        values = (
-            company_name,
-            country,
-            sector,
-            json.dumps(keywords),
-            json.dumps(results)
+    def to_ref(kind, content):
+        if content is None or is_blob_ref(content):
+            return content
+        text = json.dumps(content, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        blobs[digest] = (kind, text)
+        return {BLOB_REF: digest}
+    
+    stored = dict(results)
+    if isinstance(results.get('keyword_analysis'), list):
+        stored['keyword_analysis'] = [
+            {**entry, 'data': to_ref('component', entry['data'])}
+            if isinstance(entry, dict) and 'data' in entry else entry
+            for entry in results['keyword_analysis']
+        ]
+    if 'final_analysis' in results:
+        stored['final_analysis'] = to_ref('analysis', results['final_analysis'])
+    return stored, blobs
+
+def _result_blob_slots(results):
+    """(contenedor, clave) de cada posición de la respuesta que puede ser una referencia"""
+    if not isinstance(results, dict):
+        return
+    for entry in results.get('keyword_analysis') or []:
+        if isinstance(entry, dict):
+            yield entry, 'data'
+    yield results, 'final_analysis'
+
+def result_blob_hashes(results):
+    return {
+        container[key][BLOB_REF]
+        for container, key in _result_blob_slots(results)
+        if is_blob_ref(container.get(key))
+    }
+
+def expand_result_blobs(results, blobs):
+    """Reemplaza en el lugar las referencias por el contenido de blobs ({hash: valor})"""
+    for container, key in _result_blob_slots(results):
+        if is_blob_ref(container.get(key)):
+            container[key] = blobs.get(container[key][BLOB_REF])
+    return results
+
+def store_result_blobs(cursor, blobs):
+    """Inserta los blobs que aún no existen (misma transacción que el historial)"""
+    if blobs:
+        cursor.executemany(
+            """INSERT INTO result_blobs (hash, kind, content)
+               VALUES (%s, %s, %s)
+               ON DUPLICATE KEY UPDATE hash = hash""",
+            [(digest, kind, text) for digest, (kind, text) in blobs.items()]
         )
-        
-        cursor.execute(query, values)
-        conn.commit()
+
+def load_result_blobs(cursor, hashes):
+    """{hash: contenido} de los blobs pedidos, en una sola consulta (cursor con dictionary=True)"""
+    if not hashes:
+        return {}
+    hashes = list(hashes)
+    cursor.execute(
+        f"SELECT hash, content FROM result_blobs WHERE hash IN ({', '.join(['%s'] * len(hashes))})",
+        hashes
+    )
+    blobs = {}
+    for row in cursor.fetchall():
+        content = row['content']
+        blobs[row['hash']] = json.loads(content) if isinstance(content, (str, bytes, bytearray)) else content
+    return blobs
+
+def migrate_history_blobs(batch_size=200):
+    """
+    Pasa a result_blobs los payloads de las filas de search_history
+    guardadas antes de la tabla de blobs. Se puede ejecutar de nuevo: las
+    filas ya migradas no cambian.
+    Uso: python main.py --migrate-history-blobs
+    """
+    migrated = 0
+    last_id = 0
+    while True:
+        with db_connection() as conn:
+            if not conn:
+                return migrated
+            
+            cursor = None
+            try:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT id, results FROM search_history WHERE id > %s ORDER BY id LIMIT %s",
+                    (last_id, batch_size)
+                )
+                rows = cursor.fetchall()
+                if not rows:
+                    return migrated
+                last_id = rows[-1][0]
+                
+                blobs = {}
+                updates = []
+                for row_id, results in rows:
+                    if isinstance(results, (str, bytes, bytearray)):
+                        results = json.loads(results)
+                    stored, row_blobs = split_result_blobs(results)
+                    if row_blobs:
+                        blobs.update(row_blobs)
+                        updates.append((json.dumps(stored), row_id))
+                
+                store_result_blobs(cursor, blobs)
+                if updates:
+                    cursor.executemany("UPDATE search_history SET results = %s WHERE id = %s", updates)
+                conn.commit()
+                migrated += len(updates)
+                print(f"Filas de historial migradas: {migrated} (hasta id {last_id})")
+            except Error as e:
+                conn.rollback()
+                print(f"Error migrando blobs del historial: {e}")
+                return migrated
+            finally:
+                if cursor:
+                    cursor.close()
+
+def save_search_history(user_id, company_name, country, sector, keywords, results, created_at=None):
+    """
+    Guarda el historial de búsqueda del usuario
+    """
+    return save_search_history_batch([{
+        'user_id': user_id,
+        'company_name': company_name,
+        'country': country,
+        'sector': sector,
+        'keywords': keywords,
+        'results': results,
+        'created_at': created_at
+    }])
+
+def save_search_history_batch(entries):
+    """
+    Guarda varias entradas de historial con un único INSERT multi-fila
+    entries: lista de dicts con user_id, company_name, country, sector,
+    keywords, results y created_at ('YYYY-MM-DD HH:MM:SS' o None para NOW()).
+    Los payloads de results se guardan en result_blobs (split_result_blobs)
+    """
+    if not entries:
         return True
-    except Error as e:
-        print(f"Error guardando historial: {e}")
-        return False
+    
+    with db_connection() as conn:
+        if not conn:
+            return False
+        
+        cursor = None
+        try:
+            cursor = conn.cursor()
+            query = """INSERT INTO search_history 
+                       (user_id, company_name, country, sector, keywords, results, created_at) 
+                       VALUES (%s, %s, %s, %s, %s, %s, COALESCE(%s, NOW()))"""
+            
+            blobs = {}
+            values = []
+            for entry in entries:
+                stored, entry_blobs = split_result_blobs(entry['results'])
+                blobs.update(entry_blobs)
+                values.append((
+                    entry.get('user_id'),
+                    entry['company_name'],
+                    entry['country'],
+                    entry['sector'],
+                    json.dumps(entry['keywords']),
+                    json.dumps(stored),
+                    entry.get('created_at')
+                ))
+            
+            store_result_blobs(cursor, blobs)
+            cursor.executemany(query, values)
+            
+            # Conteos precalculados por usuario, empresa y sector (misma transacción)
+            counts = Counter()
+            for entry in entries:
+                user_id = entry.get('user_id') or ''
+                counts[(user_id, 'company', entry['company_name'] or '')] += 1
+                counts[(user_id, 'sector', entry['sector'] or '')] += 1
+            cursor.executemany(
+                """INSERT INTO search_history_counts (user_id, dimension, value, total)
+                   VALUES (%s, %s, %s, %s)
+                   ON DUPLICATE KEY UPDATE total = total + VALUES(total)""",
+                [(user_id, dimension, value, total) for (user_id, dimension, value), total in counts.items()]
+            )
+            conn.commit()
+            return True
+        except Error as e:
+            conn.rollback()
+            print(f"Error guardando historial: {e}")
+            return False
+        finally:
+            if cursor:
+                cursor.close()
+
+# Campos de search_history que se pueden pedir con ?fields=. `results` es el
+# JSON grande y solo se envía si se pide explícitamente
+HISTORY_FIELDS = ('id', 'company_name', 'country', 'sector', 'keywords', 'results', 'created_at')
+HISTORY_DEFAULT_FIELDS = ('id', 'company_name', 'country', 'sector', 'keywords', 'created_at')
+HISTORY_FILTERS = {'company': 'company_name', 'country': 'country', 'sector': 'sector'}
+
+def get_search_history_page(user_id, filters=None, fields=HISTORY_DEFAULT_FIELDS, limit=20, after=None):
+    """
+    Página del historial del usuario ordenada por (created_at, id) descendente.
+    after: (created_at, id) de la última fila de la página anterior; la
+    condición de keyset evita OFFSET y usa idx_user_created.
+    Retorna (filas, hay_más) o (None, False) si falla la BD
+    """
+    columns = list(dict.fromkeys(['id', 'created_at', *fields]))
+    conditions = ["user_id = %s"]
+    params = [user_id]
+    for name, value in (filters or {}).items():
+        conditions.append(f"{HISTORY_FILTERS[name]} = %s")
+        params.append(value)
+    if after:
+        conditions.append("(created_at < %s OR (created_at = %s AND id < %s))")
+        params.extend([after[0], after[0], after[1]])
+    
+    query = f"""SELECT {', '.join(columns)}
+                FROM search_history
+                WHERE {' AND '.join(conditions)}
+                ORDER BY created_at DESC, id DESC
+                LIMIT %s"""
+    params.append(limit + 1)
+    
+    with db_connection() as conn:
+        if not conn:
+            return None, False
+        
+        cursor = None
+        try:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+            for row in rows:
+                for field in ('keywords', 'results'):
+                    if isinstance(row.get(field), (str, bytes, bytearray)):
+                        row[field] = json.loads(row[field])
+            
+            # Los payloads de la página se leen de result_blobs en una consulta
+            if 'results' in columns:
+                page = rows[:limit]
+                hashes = set().union(*(result_blob_hashes(row['results']) for row in page))
+                blobs = load_result_blobs(cursor, hashes)
+                for row in page:
+                    expand_result_blobs(row['results'], blobs)
+        except Error as e:
+            print(f"Error consultando historial: {e}")
+            return None, False
+        finally:
+            if cursor:
+                cursor.close()
+    
+    return rows[:limit], len(rows) > limit
+
+def get_search_history_counts(user_id, dimension, limit=20):
+    """Valores con más búsquedas del usuario para una dimensión ('company' o 'sector')"""
+    with db_connection() as conn:
+        if not conn:
+            return None
+        
+        cursor = None
+        try:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(
+                """SELECT value, total FROM search_history_counts
+                   WHERE user_id = %s AND dimension = %s
+                   ORDER BY total DESC, value
+                   LIMIT %s""",
+                (user_id, dimension, limit)
+            )
+            return cursor.fetchall()
+        except Error as e:
+            print(f"Error consultando conteos de historial: {e}")
+            return None
+        finally:
+            if cursor:
+                cursor.close()
+
+def backfill_component_keys(batch_size=500):
+    """
+    Rellena components.keyword_key en las filas creadas antes de la migración
+    Uso: python main.py --backfill-keys
+    """
+    updated = 0
+    while True:
+        with db_connection() as conn:
+            if not conn:
+                return updated
+            
+            cursor = None
+            try:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT id, keyword FROM components WHERE keyword_key IS NULL LIMIT %s",
+                    (batch_size,)
+                )
+                rows = cursor.fetchall()
+                if not rows:
+                    return updated
+                
+                cursor.executemany(
+                    "UPDATE components SET keyword_key = %s WHERE id = %s",
+                    [(normalize_keyword(keyword), row_id) for row_id, keyword in rows]
+                )
+                conn.commit()
+                updated += len(rows)
+                print(f"Claves normalizadas: {updated}")
+            except Error as e:
+                print(f"Error rellenando keyword_key: {e}")
+                return updated
+            finally:
+                if cursor:
+                    cursor.close()
+
+# ==================== REFRESCO DE COMPONENTES ====================
+_refreshing = set()
+_refresh_lock = threading.Lock()
+_component_stats = {'stale_served': 0, 'refreshes_scheduled': 0, 'refreshes_completed': 0, 'refreshes_failed': 0}
+
+def _record_component_stat(key):
+    with _refresh_lock:
+        _component_stats[key] += 1
+
+def is_component_stale(component):
+    age_seconds = component.get('age_seconds')
+    return age_seconds is None or age_seconds > COMPONENT_TTL_SECONDS
+
+def schedule_component_refresh(keyword, sector, country):
+    """
+    Encola el refresco de un componente vencido sin bloquear la petición.
+    Un mismo componente no se refresca dos veces a la vez.
+    """
+    refresh_key = (normalize_keyword(keyword), normalize_context(sector), normalize_context(country))
+    with _refresh_lock:
+        if refresh_key in _refreshing:
+            return
+        _refreshing.add(refresh_key)
+        _component_stats['refreshes_scheduled'] += 1
+    _refresh_executor.submit(_refresh_component, keyword, sector, country, refresh_key)
+
+def _refresh_component(keyword, sector, country, refresh_key):
+    try:
+        # Los refrescos ceden el paso a las llamadas de /search
+        with llm_gateway.priority(BACKGROUND):
+            search_result = search_with_ai(keyword, sector, country)
+        if search_result and save_component_to_db(keyword, search_result, sector, country):
+            _record_component_stat('refreshes_completed')
+        else:
+            _record_component_stat('refreshes_failed')
+    except Exception as e:
+        print(f"Error refrescando componente {keyword}: {e}")
+        _record_component_stat('refreshes_failed')
     finally:
-        cursor.close()
-        conn.close()
+        with _refresh_lock:
+            _refreshing.discard(refresh_key)
+
+def use_component(component, sector, country):
+    """
+    Retorna los datos de un componente y, si está vencido,
+    programa su refresco en segundo plano
+    """
+    if is_component_stale(component):
+        _record_component_stat('stale_served')
+        schedule_component_refresh(component['keyword'], sector, country)
+    return json.loads(component['campo1'])
+
+def get_component_stats():
+    """Métricas de frescura de componentes"""
+    with _refresh_lock:
+        stats = dict(_component_stats)
+        stats['refreshes_in_flight'] = len(_refreshing)
+    stats['ttl_seconds'] = COMPONENT_TTL_SECONDS
+    return stats
+
+# ==================== ESCRITURAS DIFERIDAS ====================
+def _write_search_history(entries):
+    if not save_search_history_batch(entries):
+        raise RuntimeError('No se pudo guardar el historial')
+
+def _write_profile_links(links):
+    # Si un usuario aparece varias veces en el lote, gana su búsqueda más reciente
+    latest = {}
+    for link in links:
+        latest[link['user_id']] = link['company_id']
+    for user_id, company_id in latest.items():
+        get_supabase().table('user_profiles')\
+            .update({'company_id': company_id})\
+            .eq('id', user_id)\
+            .execute()
+        profile_cache.delete(user_id)
+
+write_queue.register('search_history', _write_search_history)
+write_queue.register('profile_link', _write_profile_links)
+
+def enqueue_write(kind, payload):
+    """
+    Encola una escritura diferida; si la cola está llena se hace en el momento
+    """
+    if write_queue.submit(kind, payload):
+        return
+    try:
+        write_queue.write(kind, [payload])
+    except Exception as e:
+        print(f"Error en escritura síncrona ({kind}): {e}")
+
+# ==================== DEDUPLICACIÓN DE /search ====================
+# SingleFlight y las cachés son por proceso (primer nivel). Las respuestas con
+# Idempotency-Key se guardan además en MySQL (idempotency_keys), así un
+# reintento que llega a otro worker o instancia, o después de un reinicio,
+# recibe la misma respuesta en lugar de repetir la búsqueda.
+search_flights = SingleFlight()
+idempotent_responses = TTLCache(max_entries=5000, ttl_seconds=IDEMPOTENCY_TTL_SECONDS)
+recent_searches = TTLCache(max_entries=1000, ttl_seconds=SEARCH_REPLAY_SECONDS)
+
+def search_fingerprint(user_id, company_name, country, sector, keyword_input):
+    """Identifica una búsqueda por usuario y datos normalizados"""
+    return make_cache_key(
+        'search',
+        user_id,
+        normalize_text(company_name),
+        normalize_text(country),
+        normalize_text(sector),
+        normalize_text(keyword_input)
+    )
+
+def find_stored_search(idempotency_key, fingerprint):
+    """
+    Busca una respuesta ya generada para esta petición.
+    Retorna (respuesta | None, problema): problema es 'conflict' si la misma
+    Idempotency-Key se usó antes con otros datos e 'in_progress' si otra
+    petición con la clave todavía no terminó
+    """
+    if idempotency_key:
+        stored = idempotent_responses.get(idempotency_key)
+        if stored is None:
+            stored = load_idempotency_record(idempotency_key)
+            if stored is not None and stored['body'] is not None:
+                idempotent_responses.set(idempotency_key, stored)
+        if stored is None:
+            return None, None
+        if stored['fingerprint'] != fingerprint:
+            return None, 'conflict'
+        if stored['body'] is None:
+            return None, 'in_progress'
+        return stored['body'], None
+    
+    stored = recent_searches.get(fingerprint)
+    return (stored['body'] if stored else None), None
+
+def stored_search_problem(problem):
+    """(cuerpo, status, cabeceras) de error para un problema de find_stored_search"""
+    if problem == 'conflict':
+        return {'error': 'Idempotency-Key ya usada con otros datos'}, 422, {}
+    return {'error': 'Hay una búsqueda en curso con esta Idempotency-Key'}, 409, {'Retry-After': '5'}
+
+def remember_search(idempotency_key, fingerprint, body):
+    """Guarda una respuesta exitosa para reintentos posteriores"""
+    entry = {'fingerprint': fingerprint, 'body': body}
+    recent_searches.set(fingerprint, entry)
+    if idempotency_key:
+        idempotent_responses.set(idempotency_key, entry)
+        save_idempotency_record(idempotency_key, fingerprint, body)
+
+def load_idempotency_record(idempotency_key):
+    """
+    Registro vigente de la clave en MySQL: {'fingerprint', 'body'} (body es
+    None mientras la búsqueda sigue en curso), o None
+    """
+    with db_connection() as conn:
+        if not conn:
+            return None
+        
+        cursor = None
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                """SELECT fingerprint, response FROM idempotency_keys
+                   WHERE idempotency_key = %s AND expires_at > NOW()""",
+                (idempotency_key,)
+            )
+            rows = cursor.fetchall()
+        except Error as e:
+            print(f"Error leyendo Idempotency-Key: {e}")
+            return None
+        finally:
+            if cursor:
+                cursor.close()
+    
+    if not rows:
+        return None
+    fingerprint, response = rows[0]
+    if isinstance(response, (str, bytes, bytearray)):
+        response = json.loads(response)
+    return {'fingerprint': fingerprint, 'body': response}
+
+def claim_idempotency_key(idempotency_key, fingerprint):
+    """
+    Reserva la clave en MySQL antes de ejecutar la búsqueda, para que un
+    reintento en otro worker o instancia no la ejecute también.
+    Retorna None si esta petición debe ejecutar la búsqueda (también sin
+    clave o sin BD, donde solo queda la caché del proceso); si no, el
+    (cuerpo, status, cabeceras) que corresponde responder
+    """
+    if not idempotency_key:
+        return None
+    
+    with db_connection() as conn:
+        if not conn:
+            return None
+        
+        cursor = None
+        try:
+            cursor = conn.cursor()
+            # Las claves vencidas se pueden volver a usar
+            cursor.execute(
+                "DELETE FROM idempotency_keys WHERE idempotency_key = %s AND expires_at <= NOW()",
+                (idempotency_key,)
+            )
+            cursor.execute(
+                """INSERT INTO idempotency_keys (idempotency_key, fingerprint, expires_at)
+                   VALUES (%s, %s, DATE_ADD(NOW(), INTERVAL %s SECOND))""",
+                (idempotency_key, fingerprint, IDEMPOTENCY_PENDING_SECONDS)
+            )
+            conn.commit()
+            return None
+        except Error as e:
+            conn.rollback()
+            # 1062 = clave duplicada: otra petición ya la reservó
+            if getattr(e, 'errno', None) != 1062:
+                print(f"Error reservando Idempotency-Key: {e}")
+                return None
+        finally:
+            if cursor:
+                cursor.close()
+    
+    stored, problem = find_stored_search(idempotency_key, fingerprint)
+    if stored is not None:
+        return stored, 200, {'Idempotent-Replayed': 'true'}
+    return stored_search_problem(problem or 'in_progress')
+
+def save_idempotency_record(idempotency_key, fingerprint, body):
+    """Guarda la respuesta de la clave en MySQL (completa la reserva si la hay)"""
+    with db_connection() as conn:
+        if not conn:
+            return False
+        
+        cursor = None
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                """INSERT INTO idempotency_keys (idempotency_key, fingerprint, response, expires_at)
+                   VALUES (%s, %s, %s, DATE_ADD(NOW(), INTERVAL %s SECOND))
+                   ON DUPLICATE KEY UPDATE response = VALUES(response), expires_at = VALUES(expires_at)""",
+                (idempotency_key, fingerprint, json.dumps(body), IDEMPOTENCY_TTL_SECONDS)
+            )
+            conn.commit()
+            return True
+        except Error as e:
+            conn.rollback()
+            print(f"Error guardando Idempotency-Key: {e}")
+            return False
+        finally:
+            if cursor:
+                cursor.close()
+
+def release_idempotency_key(idempotency_key):
+    """Libera una reserva sin respuesta (la búsqueda falló) para permitir el reintento"""
+    if not idempotency_key:
+        return
+    with db_connection() as conn:
+        if not conn:
+            return
+        
+        cursor = None
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "DELETE FROM idempotency_keys WHERE idempotency_key = %s AND response IS NULL",
+                (idempotency_key,)
+            )
+            conn.commit()
+        except Error as e:
+            conn.rollback()
+            print(f"Error liberando Idempotency-Key: {e}")
+        finally:
+            if cursor:
+                cursor.close()
+
+def purge_idempotency_keys(batch_size=1000):
+    """
+    Borra las Idempotency-Key vencidas
+    Uso: python main.py --purge-idempotency-keys
+    """
+    purged = 0
+    while True:
+        with db_connection() as conn:
+            if not conn:
+                return purged
+            
+            cursor = None
+            try:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "DELETE FROM idempotency_keys WHERE expires_at <= NOW() LIMIT %s",
+                    (batch_size,)
+                )
+                deleted = cursor.rowcount
+                conn.commit()
+            except Error as e:
+                print(f"Error borrando Idempotency-Key vencidas: {e}")
+                return purged
+            finally:
+                if cursor:
+                    cursor.close()
+        purged += deleted
+        if deleted < batch_size:
+            return purged
+
+def get_search_dedup_stats():
+    """Métricas de coalescencia y reintentos de /search"""
+    return {
+        'single_flight': search_flights.stats(),
+        'idempotent_responses': idempotent_responses.stats(),
+        'recent_searches': recent_searches.stats()
+    }
+
+# ==================== REUTILIZACIÓN DE ANÁLISIS ====================
+recent_analyses = TTLCache(max_entries=2000, ttl_seconds=max(ANALYSIS_REUSE_SECONDS, 1))
+_reuse_stats = {'memory_hits': 0, 'db_hits': 0, 'misses': 0, 'errors': 0}
+_reuse_lock = threading.Lock()
+
+def _record_reuse(key):
+    with _reuse_lock:
+        _reuse_stats[key] += 1
+
+def company_identity(company_name, country, sector, keyword_input):
+    """
+    Clave normalizada de un análisis (sin mayúsculas, tildes ni espacios
+    extra): la empresa y el input de keywords, ya que el análisis de otras
+    keywords no sirve para quien pidió estas. Se guarda en
+    companies.analysis_key
+    """
+    return make_cache_key(
+        'analysis',
+        normalize_context(company_name),
+        normalize_context(country),
+        normalize_context(sector),
+        normalize_context(keyword_input)
+    )
+
+def remember_analysis(company_name, country, sector, keyword_input, company_id, response):
+    """Registra el análisis recién creado para que otros usuarios lo reutilicen"""
+    if ANALYSIS_REUSE_SECONDS > 0:
+        recent_analyses.set(
+            company_identity(company_name, country, sector, keyword_input),
+            {'company_id': company_id, 'response': response,
+             'expires_at': time.time() + ANALYSIS_REUSE_SECONDS}
+        )
+
+def find_recent_analysis(company_name, country, sector, keyword_input):
+    """
+    Busca un análisis de la misma empresa y las mismas keywords hecho dentro
+    de la ventana de frescura. Retorna (company_id, response) o None
+    """
+    if ANALYSIS_REUSE_SECONDS <= 0:
+        return None
+    
+    identity = company_identity(company_name, country, sector, keyword_input)
+    cached = recent_analyses.get(identity)
+    # La ventana se cuenta desde que se creó el análisis, no desde que se cacheó
+    if cached is not None and cached['expires_at'] > time.time():
+        _record_reuse('memory_hits')
+        return cached['company_id'], cached['response']
+    
+    try:
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=ANALYSIS_REUSE_SECONDS)
+        # companies.analysis_key = company_identity (índice idx_companies_analysis_key)
+        result = get_supabase().table('companies')\
+            .select('id, search_results, created_at')\
+            .eq('analysis_key', identity)\
+            .gte('created_at', cutoff.isoformat())\
+            .order('created_at', desc=True)\
+            .limit(5)\
+            .execute()
+    except Exception as e:
+        _record_reuse('errors')
+        print(f"Error buscando análisis reciente de {company_name}: {e}")
+        return None
+    
+    for row in result.data or []:
+        if not row.get('search_results') or row['search_results'].get('degraded'):
+            continue
+        _record_reuse('db_hits')
+        try:
+            created_at = datetime.fromisoformat(row['created_at'].replace('Z', '+00:00'))
+            if created_at.tzinfo is None:
+                created_at = created_at.replace(tzinfo=timezone.utc)
+            recent_analyses.set(identity, {
+                'company_id': row['id'],
+                'response': row['search_results'],
+                'expires_at': created_at.timestamp() + ANALYSIS_REUSE_SECONDS
+            })
+        except (AttributeError, KeyError, ValueError):
+            pass
+        return row['id'], row['search_results']
+    
+    _record_reuse('misses')
+    return None
+
+def reuse_recent_analysis(user_id, company_name, country, sector, keyword_input):
+    """
+    Si existe un análisis fresco de la empresa con el mismo input de
+    keywords, vincula al usuario con él y retorna el cuerpo de respuesta de
+    /search; si no, retorna None
+    """
+    found = find_recent_analysis(company_name, country, sector, keyword_input)
+    if found is None:
+        return None
+    
+    company_id, response = found
+    record_user_search(
+        user_id, company_id, company_name, country, sector,
+        [kr.get('keyword') for kr in response.get('keyword_analysis', [])],
+        response
+    )
+    return {
+        'success': True,
+        'company_id': company_id,
+        'data': response,
+        'reused': True
+    }
+
+def get_reuse_stats():
+    with _reuse_lock:
+        stats = dict(_reuse_stats)
+    stats['window_seconds'] = ANALYSIS_REUSE_SECONDS
+    stats['cache'] = recent_analyses.stats()
+    return stats
 
 # ==================== LÓGICA PRINCIPAL ====================
-def process_keywords(keyword_input, sector, country):
+def iter_research_keywords(keywords, sector, country):
+    """
+    Investiga con IA las keywords que no están en BD ni tienen sinónimo.
+    Se envían en lotes de RESEARCH_BATCH_SIZE por llamada (los lotes corren
+    en paralelo) y las que el modelo omita se investigan una por una.
+    Genera tuplas (keyword, resultado) a medida que cada lote termina
+    """
+    if not keywords:
+        return
+    if len(keywords) == 1:
+        search_result = search_with_ai(keywords[0], sector, country)
+        if search_result:
+            yield keywords[0], search_result
+        return
+    
+    batches = [
+        keywords[i:i + RESEARCH_BATCH_SIZE]
+        for i in range(0, len(keywords), RESEARCH_BATCH_SIZE)
+    ]
+    found = set()
+    # bind: las llamadas de los hilos del executor cuentan para la petición actual
+    futures = [_llm_executor.submit(llm_usage.bind(search_many_with_ai), batch, sector, country) for batch in batches]
+    for future in as_completed(futures):
+        for keyword, search_result in future.result().items():
+            found.add(keyword)
+            yield keyword, search_result
+    
+    missing = [keyword for keyword in keywords if keyword not in found]
+    futures = {_llm_executor.submit(llm_usage.bind(search_with_ai), k, sector, country): k for k in missing}
+    for future in as_completed(futures):
+        search_result = future.result()
+        if search_result:
+            yield futures[future], search_result
+
+def analyze_keywords(keyword_input, index):
+    """
+    Paso de análisis del pipeline. Si hay componentes parecidos al input,
+    usa el análisis fusionado (keywords + sinónimos en una sola llamada);
+    si no, el análisis simple.
+    Retorna una lista de tuplas (keyword, matched_word | None)
+    """
+    candidates = select_candidate_keywords(keyword_input, index) if len(index) else []
+    if not candidates:
+        analyzed = [(keyword, None) for keyword in analyze_keywords_with_ai(keyword_input)]
+    else:
+        analyzed = [
+            (item['keyword'], item['matched_word'])
+            for item in analyze_and_match_keywords_with_ai(keyword_input, candidates)
+        ]
+    
+    # Modo degradado: sin respuesta del LLM se descompone el input localmente
+    # (los sinónimos se resuelven luego solo con el índice local)
+    if not analyzed:
+        analyzed = [(keyword, None) for keyword in split_keywords_locally(keyword_input)]
+    return analyzed
+
+_STOPWORDS = {
+    'a', 'al', 'con', 'de', 'del', 'e', 'el', 'en', 'la', 'las', 'lo', 'los',
+    'o', 'para', 'por', 'u', 'un', 'una', 'y'
+}
+
+def split_keywords_locally(keyword_input, limit=5):
+    """
+    Descomposición del input sin LLM: por comas/punto y coma si los hay y,
+    si no, por palabras (sin artículos ni preposiciones)
+    """
+    if any(sep in keyword_input for sep in ',;\n'):
+        parts = keyword_input.replace(';', ',').replace('\n', ',').split(',')
+    else:
+        parts = [word for word in keyword_input.split() if word.lower() not in _STOPWORDS]
+    
+    keywords = {}
+    for part in parts:
+        part = ' '.join(part.split()).lower()
+        key = normalize_keyword(part)
+        if key and key not in keywords:
+            keywords[key] = part
+    return list(keywords.values())[:limit]
+
+def iter_keyword_results(keyword_input, sector, country):
     """
     Procesa las palabras clave: analiza, busca en BD o ejecuta nueva búsqueda
+    Las keywords se comparan por su clave normalizada (normalize_keyword), y
+    las lecturas y escrituras de componentes se hacen en lote, de modo que
+    el número de consultas a la BD no depende del número de keywords.
+    El análisis y la resolución de sinónimos van en una sola llamada al LLM
+    (analyze_keywords); las keywords que quedan sin componente se
+    investigan juntas con iter_research_keywords.
+    Los componentes se reutilizan solo dentro del mismo (sector, país); los
+    vencidos se sirven igual y se refrescan en segundo plano.
+    
+    Es un generador: primero produce ('keywords', [keywords optimizadas]) y
+    luego ('result', posición, resultado) a medida que cada keyword se
+    resuelve; la posición es el índice de la keyword en la lista optimizada.
     """
-    # 1. Analizar y optimizar keywords con IA
-    optimized_keywords = analyze_keywords_with_ai(keyword_input)
+    # 1. Obtener lista de componentes existentes en este contexto
+    existing_keywords = get_all_component_keywords(sector, country)
+    existing_keys = {normalize_keyword(k) for k in existing_keywords}
+    index = get_keyword_index(sector, country, existing_keywords)
     
-    if not optimized_keywords:
-        return []
+    # 2. Analizar y optimizar keywords con IA, ya asociadas a sinónimos
+    analyzed = analyze_keywords(keyword_input, index)
+    
+    if not analyzed:
+        return
+    
+    optimized_keywords = [keyword for keyword, _ in analyzed]
+    yield 'keywords', optimized_keywords
     
-    # 2. Obtener lista de componentes existentes
-    existing_keywords = get_all_component_keywords()
+    # 3. Sinónimos de las keywords que no están en BD (una vez por clave):
+    #    los que indicó el LLM y, para el resto, solo coincidencias locales claras
+    pending = {}
+    synonyms = {}
+    for keyword, matched_word in analyzed:
+        key = normalize_keyword(keyword)
+        if key in existing_keys or key in pending:
+            continue
+        pending[key] = keyword
+        if matched_word:
+            _record_synonym_stat('fused_matches')
+            synonyms[key] = matched_word
+        elif len(index):
+            synonym_check = resolve_synonym(keyword, index)
+            if synonym_check['is_synonym']:
+                synonyms[key] = synonym_check['matched_word']
     
-    results = []
+    # 4. Una sola lectura para coincidencias directas y destinos de sinónimos
+    candidates = [k for k in optimized_keywords if normalize_keyword(k) in existing_keys]
+    candidates.extend(synonyms.values())
+    components = get_components_from_db(candidates, sector, country)
     
-    # 3. Procesar cada keyword optimizada
-    for keyword in optimized_keywords:
-        # 3.1 Verificar si ya existe en BD
-        db_component = get_component_from_db(keyword)
+    # 4.1 Sin sinónimo (o si su componente desapareció): nueva búsqueda en lote
+    synonyms = {
+        key: matched_word for key, matched_word in synonyms.items()
+        if normalize_keyword(matched_word) in components
+    }
+    to_research = [keyword for key, keyword in pending.items() if key not in synonyms]
+    
+    # 5. Resultados de BD y sinónimos (ya disponibles)
+    positions = {}
+    for position, keyword in enumerate(optimized_keywords):
+        key = normalize_keyword(keyword)
+        db_component = components.get(key)
         
         if db_component:
             # Ya existe, usar datos guardados
-            results.append({
+            yield 'result', position, {
                 'keyword': keyword,
                 'source': 'database',
-                'data': json.loads(db_component['campo1'])
-            })
+                'data': use_component(db_component, sector, country)
+            }
+        elif key in synonyms:
+            # Usar el componente del sinónimo
+            matched_word = synonyms[key]
+            yield 'result', position, {
+                'keyword': keyword,
+                'original_keyword': matched_word,
+                'source': 'synonym',
+                'data': use_component(components[normalize_keyword(matched_word)], sector, country)
+            }
         else:
-            # 3.2 Verificar si es sinónimo de alguno existente
-            if existing_keywords:
-                synonym_check = check_synonym_with_ai(keyword, existing_keywords)
-                
-                if synonym_check['is_synonym'] and synonym_check['matched_word']:
-                    # Usar el componente del sinónimo
-                    synonym_component = get_component_from_db(synonym_check['matched_word'])
-                    if synonym_component:
-                        results.append({
-                            'keyword': keyword,
-                            'original_keyword': synonym_check['matched_word'],
-                            'source': 'synonym',
-                            'data': json.loads(synonym_component['campo1'])
-                        })
-                        continue
-            
-            # 3.3 No existe y no tiene sinónimo: hacer nueva búsqueda
-            search_result = search_with_ai(keyword, sector, country)
-            
-            if search_result:
-                # Guardar en BD para futuras búsquedas
-                save_component_to_db(keyword, search_result)
-                
-                results.append({
-                    'keyword': keyword,
-                    'source': 'new_search',
-                    'data': search_result
-                })
+            positions.setdefault(key, []).append(position)
     
-    return results
+    # 6. Nuevas búsquedas, a medida que cada lote responde
+    new_components = []
+    for researched_keyword, search_result in iter_research_keywords(to_research, sector, country):
+        key = normalize_keyword(researched_keyword)
+        new_components.append((researched_keyword, search_result))
+        for position in positions.get(key, []):
+            yield 'result', position, {
+                'keyword': optimized_keywords[position],
+                'source': 'new_search',
+                'data': search_result
+            }
+    
+    # 7. Guardar en BD para futuras búsquedas (un único upsert)
+    if save_components_to_db(new_components, sector, country):
+        index.update(keyword.lower() for keyword, _ in new_components)
+
+def process_keywords(keyword_input, sector, country):
+    """
+    Procesa las palabras clave (ver iter_keyword_results) y retorna los
+    resultados en el orden de las keywords optimizadas
+    """
+    results = {}
+    for event in iter_keyword_results(keyword_input, sector, country):
+        if event[0] == 'result':
+            _, position, result = event
+            results[position] = result
+    return [results[position] for position in sorted(results)]
 
 # ==================== ENDPOINTS ====================
 @app.route('/', methods=['GET'])
@@ -403,6 +1842,27 @@ def home():
         'message': 'API de búsqueda empresarial'
     })
 
+@app.route('/metrics', methods=['GET'])
+@require_metrics_token
+def metrics():
+    """Métricas internas del servicio"""
+    return jsonify({
+        'db_pool': get_db_pool_stats(),
+        'synonyms': get_synonym_stats(),
+        'llm_cache': llm_response_cache.stats(),
+        'components': get_component_stats(),
+        'auth': token_verifier.stats(),
+        'write_behind': write_queue.stats(),
+        'search_dedup': get_search_dedup_stats(),
+        'analysis_reuse': get_reuse_stats(),
+        'profiles': profile_cache.stats(),
+        'llm_gateway': llm_gateway.stats(),
+        'llm_breaker': llm_breaker.stats(),
+        'llm_usage': llm_usage.stats(),
+        'prompts': prompt_builder.stats(),
+        'startup': startup_report()
+    }), 200
+
 # ==================== ENDPOINTS DE AUTENTICACIÓN ====================
 @app.route('/auth/callback', methods=['POST'])
 def auth_callback():
@@ -414,27 +1874,22 @@ def auth_callback():
         if not access_token:
             return jsonify({'error': 'Token no proporcionado'}), 400
         
-        user = supabase.auth.get_user(access_token)
+        user_data = get_user_from_token(access_token)
         
-        if not user:
+        if not user_data:
             return jsonify({'error': 'Usuario no encontrado'}), 404
         
-        user_data = user.user
-        
-        # Verificar si el perfil existe
-        profile = supabase.table('user_profiles')\
-            .select('*')\
-            .eq('id', user_data.id)\
+        # Crear el perfil si no existe, en una sola llamada: si ya existe no
+        # se modifica (y dos callbacks simultáneos no chocan entre sí)
+        profile_data = {
+            'id': user_data.id,
+            'full_name': user_data.user_metadata.get('full_name', ''),
+            'company_id': None
+        }
+        get_supabase().table('user_profiles')\
+            .upsert(profile_data, on_conflict='id', ignore_duplicates=True)\
             .execute()
-        
-        if not profile.data:
-            # Crear perfil si no existe
-            profile_data = {
-                'id': user_data.id,
-                'full_name': user_data.user_metadata.get('full_name', ''),
-                'company_id': None
-            }
-            supabase.table('user_profiles').insert(profile_data).execute()
+        profile_cache.delete(user_data.id)
         
         return jsonify({
             'success': True,
@@ -456,15 +1911,19 @@ def get_current_user():
     try:
         user_id = request.user.id
         
-        profile = supabase.table('user_profiles')\
-            .select('*, companies(id, name, created_at)')\
-            .eq('id', user_id)\
-            .single()\
-            .execute()
+        user_profile = profile_cache.get(user_id)
+        if user_profile is None:
+            profile = get_supabase().table('user_profiles')\
+                .select('*, companies(id, name, created_at)')\
+                .eq('id', user_id)\
+                .single()\
+                .execute()
+            user_profile = profile.data
+            profile_cache.set(user_id, user_profile)
         
         return jsonify({
             'success': True,
-            'user': profile.data
+            'user': user_profile
         }), 200
         
     except Exception as e:
@@ -476,7 +1935,9 @@ def get_current_user():
 def logout():
     """Cierra sesión del usuario"""
     try:
-        supabase.auth.sign_out()
+        get_supabase().auth.sign_out()
+        token_verifier.forget(request.headers.get('Authorization', '').split(' ')[-1])
+        profile_cache.delete(request.user.id)
         
         return jsonify({
             'success': True,
@@ -497,6 +1958,195 @@ def verify_token():
         'email': request.user.email
     }), 200
 
+def finalize_search(user_id, company_name, country, sector, keyword_input, keyword_results):
+    """
+    Genera el análisis consolidado, crea la empresa en Supabase y encola
+    las escrituras diferidas. Retorna (company_id, response)
+    """
+    # Generar análisis final consolidado
+    final_results = generate_final_results_with_ai(
+        keyword_results, 
+        company_name, 
+        sector, 
+        country
+    )
+    
+    # Preparar respuesta
+    response = {
+        'company_name': company_name,
+        'country': country,
+        'sector': sector,
+        'keyword_analysis': keyword_results,
+        'final_analysis': final_results,
+        # Sin análisis consolidado (DeepSeek no disponible): no se reutiliza
+        'degraded': final_results is None,
+        'timestamp': None
+    }
+    
+    #Crear la empresa en Supabase
+    company_data = {
+        'analysis_key': company_identity(company_name, country, sector, keyword_input),
+        'name': company_name,
+        'country': country,
+        'sector': sector,
+        'keywords': {
+            'original': keyword_input,
+            'processed': [kr['keyword'] for kr in keyword_results]
+        },
+        'search_results': response
+    }
+    
+    # La inserción es síncrona porque asigna el company_id de la respuesta
+    company_id, linked = create_company(user_id, company_data)
+    if not response['degraded']:
+        remember_analysis(company_name, country, sector, keyword_input, company_id, response)
+    
+    record_user_search(
+        user_id, company_id, company_name, country, sector,
+        [kr['keyword'] for kr in keyword_results],
+        response,
+        link_profile=not linked
+    )
+    
+    return company_id, response
+
+_company_rpc_available = True
+
+def create_company(user_id, company_data):
+    """
+    Crea la empresa y la vincula al perfil con la RPC create_company_and_link
+    (una llamada, una transacción; ver supabase_functions.sql). Si la función
+    no está instalada se hace solo el insert, sin analysis_key (la columna se
+    crea en el mismo script), así la empresa no se reutiliza.
+    Retorna (company_id, vinculada)
+    """
+    global _company_rpc_available
+    if _company_rpc_available:
+        try:
+            result = get_supabase().rpc('create_company_and_link', {
+                'p_user_id': user_id,
+                'p_name': company_data['name'],
+                'p_country': company_data['country'],
+                'p_sector': company_data['sector'],
+                'p_keywords': company_data['keywords'],
+                'p_search_results': company_data['search_results'],
+                'p_analysis_key': company_data['analysis_key']
+            }).execute()
+            profile_cache.delete(user_id)
+            return result.data, True
+        except Exception as e:
+            # PGRST202: la función no existe en el esquema
+            if getattr(e, 'code', None) != 'PGRST202':
+                raise
+            _company_rpc_available = False
+            print("RPC create_company_and_link no disponible, se usa insert + update")
+    
+    company_data = {key: value for key, value in company_data.items() if key != 'analysis_key'}
+    company_result = get_supabase().table('companies').insert(company_data).execute()
+    return company_result.data[0]['id'], False
+
+def record_user_search(user_id, company_id, company_name, country, sector, keywords, response, link_profile=True):
+    """Vincula la empresa al perfil y guarda el historial (ambos diferidos)"""
+    # Actualizar el perfil del usuario con esta empresa
+    if link_profile:
+        enqueue_write('profile_link', {'user_id': user_id, 'company_id': company_id})
+    
+    #Guardar en historial
+    enqueue_write('search_history', {
+        'user_id': user_id,
+        'company_name': company_name,
+        'country': country,
+        'sector': sector,
+        'keywords': keywords,
+        'results': response,
+        'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    })
+
+def empty_search_error():
+    """(cuerpo, status) cuando ninguna keyword obtuvo resultado"""
+    if llm_breaker.state != CLOSED:
+        return {'error': 'El servicio de IA no está disponible, intenta de nuevo en unos minutos'}, 503
+    return {'error': 'No se pudieron procesar las palabras clave'}, 500
+
+def sse_event(event, data):
+    """Formatea un evento server-sent events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def wants_stream():
+    """El modo streaming es opcional: ?stream=1 o Accept: text/event-stream"""
+    if request.args.get('stream', '').lower() in ('1', 'true'):
+        return True
+    return 'text/event-stream' in request.headers.get('Accept', '')
+
+def report_llm_usage(usage, company_name):
+    """
+    Registra en el log el resumen de las llamadas al LLM de una petición y
+    retorna la cabecera X-LLM-Usage (totales, sin el desglose por call site)
+    """
+    summary = usage.summary()
+    if not summary['calls'] and not summary['cache_hits']:
+        return {}
+    print(f"[llm] /search {company_name}: {usage.describe()}")
+    del summary['by_call_site']
+    return {'X-LLM-Usage': json.dumps(summary)}
+
+def stream_search(user_id, company_name, country, sector, keyword_input, idempotency_key=None, fingerprint=None):
+    """
+    Variante SSE de /search. Eventos:
+    - keywords: keywords optimizadas
+    - keyword_result: {"position": n, "result": {...}} por cada keyword resuelta
+    - final_analysis: {"company_id": ..., "data": respuesta completa}
+    - llm_usage: llamadas, tokens, costo y tiempo del LLM en esta búsqueda
+    - error: {"error": mensaje}
+    """
+    with llm_usage.request_scope() as usage:
+        yield from _stream_search(user_id, company_name, country, sector, keyword_input, idempotency_key, fingerprint)
+    if report_llm_usage(usage, company_name):
+        yield sse_event('llm_usage', usage.summary())
+
+def _stream_search(user_id, company_name, country, sector, keyword_input, idempotency_key, fingerprint):
+    claimed = claim_idempotency_key(idempotency_key, fingerprint)
+    if claimed is not None:
+        body, status, _ = claimed
+        yield sse_event('final_analysis' if status == 200 else 'error', body)
+        return
+    
+    completed = False
+    try:
+        results = {}
+        for event in iter_keyword_results(keyword_input, sector, country):
+            if event[0] == 'keywords':
+                yield sse_event('keywords', {'keywords': event[1]})
+            else:
+                _, position, result = event
+                results[position] = result
+                yield sse_event('keyword_result', {'position': position, 'result': result})
+        
+        keyword_results = [results[position] for position in sorted(results)]
+        if not keyword_results:
+            body, _ = empty_search_error()
+            yield sse_event('error', body)
+            return
+        
+        company_id, response = finalize_search(
+            user_id, company_name, country, sector, keyword_input, keyword_results
+        )
+        body = {
+            'success': True,
+            'company_id': company_id,
+            'data': response
+        }
+        remember_search(idempotency_key, fingerprint, body)
+        completed = True
+        yield sse_event('final_analysis', body)
+    except Exception as e:
+        print(f"Error en endpoint /search (stream): {e}")
+        yield sse_event('error', {'error': 'Error interno del servidor'})
+    finally:
+        # Error o cliente desconectado: el reintento debe poder ejecutarse
+        if not completed:
+            release_idempotency_key(idempotency_key)
+
 @app.route('/search', methods=['POST'])
 @require_auth
 def search():
@@ -517,78 +2167,197 @@ def search():
         sector = data['sector']
         keyword_input = data['keyword']
         
-        # Procesar keywords
-        keyword_results = process_keywords(keyword_input, sector, country)
+        # Reintentos: misma Idempotency-Key (o misma búsqueda reciente)
+        fingerprint = search_fingerprint(user_id, company_name, country, sector, keyword_input)
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if idempotency_key:
+            idempotency_key = make_cache_key('idempotency', user_id, idempotency_key)
         
-        if not keyword_results:
-            return jsonify({'error': 'No se pudieron procesar las palabras clave'}), 500
-        
-        # Generar análisis final consolidado
-        final_results = generate_final_results_with_ai(
-            keyword_results, 
-            company_name, 
-            sector, 
-            country
-        )
+        # Una clave en curso (doble clic) no se rechaza aquí: la petición entra
+        # al single-flight y espera a la ejecución de este proceso; si la
+        # ejecución está en otro worker, claim_idempotency_key responde 409
+        stored, problem = find_stored_search(idempotency_key, fingerprint)
+        if problem == 'conflict':
+            body, status, headers = stored_search_problem(problem)
+            return jsonify(body), status, headers
+        replayed = stored is not None
         
-        # Preparar respuesta
-        response = {
-            'company_name': company_name,
-            'country': country,
-            'sector': sector,
-            'keyword_analysis': keyword_results,
-            'final_analysis': final_results,
-            'timestamp': None
-        }
+        # Si otro usuario ya analizó esta empresa con las mismas keywords hace poco, se reutiliza
+        if not replayed and not problem:
+            stored = reuse_recent_analysis(user_id, company_name, country, sector, keyword_input)
+            if stored:
+                remember_search(idempotency_key, fingerprint, stored)
         
-        #Crear la empresa en Supabase
-        company_data = {
-            'name': company_name,
-            'country': country,
-            'sector': sector,
-            'keywords': {
-                'original': keyword_input,
-                'processed': [kr['keyword'] for kr in keyword_results]
-            },
-            'search_results': response
-        }
+        # Modo streaming (SSE): cada resultado se envía apenas está listo
+        if wants_stream():
+            events = [sse_event('final_analysis', stored)] if stored else stream_with_context(
+                stream_search(user_id, company_name, country, sector, keyword_input, idempotency_key, fingerprint)
+            )
+            return Response(
+                events,
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
         
-        company_result = supabase.table('companies').insert(company_data).execute()
-        company_id = company_result.data[0]['id']
+        if stored:
+            return jsonify(stored), 200, ({'Idempotent-Replayed': 'true'} if replayed else {})
         
-        # Actualizar el perfil del usuario con esta empresa
-        supabase.table('user_profiles')\
-            .update({'company_id': company_id})\
-            .eq('id', user_id)\
-            .execute()
-        
-        #Guardar en historial
-        save_search_history(
-            company_name, 
-            country, 
-            sector, 
-            [kr['keyword'] for kr in keyword_results],
-            response
-        )
+        def run_search():
+            # Otro worker o instancia pudo haber tomado la misma Idempotency-Key
+            claimed = claim_idempotency_key(idempotency_key, fingerprint)
+            if claimed is not None:
+                return claimed
+            try:
+                # Procesar keywords
+                keyword_results = process_keywords(keyword_input, sector, country)
+                
+                if not keyword_results:
+                    release_idempotency_key(idempotency_key)
+                    return (*empty_search_error(), {})
+                
+                company_id, response = finalize_search(
+                    user_id, company_name, country, sector, keyword_input, keyword_results
+                )
+            except Exception:
+                release_idempotency_key(idempotency_key)
+                raise
+            body = {
+                'success': True,
+                'company_id': company_id,
+                'data': response
+            }
+            remember_search(idempotency_key, fingerprint, body)
+            return body, 200, {}
         
-        return jsonify({
-            'success': True,
-            'company_id': company_id,
-            'data': response
-        }), 200
+        # Peticiones idénticas en curso comparten una sola ejecución del pipeline
+        # (las que esperan no hacen llamadas y no reciben X-LLM-Usage)
+        with llm_usage.request_scope() as usage:
+            (body, status, headers), shared = search_flights.do(fingerprint, run_search)
+        # La ejecución compartida guardó la respuesta con la clave de quien la
+        # ejecutó; un reintento con la clave de esta petición también debe recibirla
+        if shared and status == 200:
+            remember_search(idempotency_key, fingerprint, body)
+        return jsonify(body), status, {**headers, **report_llm_usage(usage, company_name)}
         
     except Exception as e:
         print(f"Error en endpoint /search: {e}")
         return jsonify({'error': 'Error interno del servidor'}), 500
 
+def encode_cursor(row):
+    """Cursor opaco a partir de (created_at, id) de la última fila"""
+    raw = json.dumps([row['created_at'].strftime('%Y-%m-%d %H:%M:%S'), row['id']])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """Inverso de encode_cursor; lanza ValueError si el cursor no es válido"""
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S'), int(row_id)
+    except Exception:
+        raise ValueError('Cursor inválido')
+
 @app.route('/results', methods=['GET'])
+@require_auth
 def results():
     """
-    Endpoint para obtener resultados guardados (opcional)
+    Historial de búsquedas del usuario autenticado, paginado (más recientes primero).
+    Query params:
+    - limit: filas por página (máx. RESULTS_MAX_LIMIT)
+    - cursor: next_cursor de la página anterior
+    - company, country, sector: filtros exactos
+    - fields: campos separados por coma; `results` solo se envía si se pide
     """
-    return jsonify({'message': 'Endpoint de resultados'}), 200
+    try:
+        limit = min(max(int(request.args.get('limit', RESULTS_DEFAULT_LIMIT)), 1), RESULTS_MAX_LIMIT)
+    except ValueError:
+        return jsonify({'error': 'limit debe ser un número'}), 400
+    
+    fields = HISTORY_DEFAULT_FIELDS
+    if request.args.get('fields'):
+        fields = tuple(f.strip() for f in request.args['fields'].split(',') if f.strip())
+        unknown = [f for f in fields if f not in HISTORY_FIELDS]
+        if unknown:
+            return jsonify({'error': f"Campos no soportados: {', '.join(unknown)}"}), 400
+    
+    after = None
+    if request.args.get('cursor'):
+        try:
+            after = decode_cursor(request.args['cursor'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    
+    filters = {name: request.args[name] for name in HISTORY_FILTERS if request.args.get(name)}
+    
+    rows, has_more = get_search_history_page(request.user.id, filters, fields, limit, after)
+    if rows is None:
+        return jsonify({'error': 'Error consultando el historial'}), 500
+    
+    next_cursor = encode_cursor(rows[-1]) if has_more else None
+    requested = set(fields)
+    for row in rows:
+        row['created_at'] = row['created_at'].isoformat()
+        for field in ('id', 'created_at'):
+            if field not in requested:
+                row.pop(field)
+    
+    return jsonify({
+        'success': True,
+        'data': rows,
+        'next_cursor': next_cursor
+    }), 200
+
+@app.route('/results/counts', methods=['GET'])
+@require_auth
+def results_counts():
+    """
+    Conteos precalculados de búsquedas del usuario autenticado por empresa y por sector.
+    Query params: dimension (company | sector, por defecto ambas) y limit
+    """
+    dimension = request.args.get('dimension')
+    if dimension and dimension not in ('company', 'sector'):
+        return jsonify({'error': 'dimension debe ser company o sector'}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', RESULTS_DEFAULT_LIMIT)), 1), RESULTS_MAX_LIMIT)
+    except ValueError:
+        return jsonify({'error': 'limit debe ser un número'}), 400
+    
+    counts = {}
+    for name in ([dimension] if dimension else ['company', 'sector']):
+        rows = get_search_history_counts(request.user.id, name, limit)
+        if rows is None:
+            return jsonify({'error': 'Error consultando los conteos'}), 500
+        counts[name] = rows
+    
+    return jsonify({'success': True, 'counts': counts}), 200
 
 # ==================== INICIALIZACIÓN ====================
+def warm_up_clients():
+    """Crea los clientes diferidos en segundo plano, fuera del camino del arranque"""
+    try:
+        get_supabase()
+        if DEEPSEEK_API_KEY:
+            get_llm_client()
+        get_db_pool()
+    except Exception as e:
+        print(f"Error precalentando clientes: {e}")
+
+mark_ready()
+if os.getenv('STARTUP_REPORT') == '1':
+    print_report()
+MAINTENANCE_COMMANDS = ('--backfill-keys', '--migrate-history-blobs', '--purge-idempotency-keys')
+if os.getenv('WARM_UP_CLIENTS', '1') == '1' and not any(arg in MAINTENANCE_COMMANDS for arg in sys.argv):
+    threading.Thread(target=warm_up_clients, name='warm-up', daemon=True).start()
+
 if __name__ == '__main__':
+    if '--backfill-keys' in sys.argv:
+        print(f"Filas actualizadas: {backfill_component_keys()}")
+        sys.exit(0)
+    if '--migrate-history-blobs' in sys.argv:
+        print(f"Filas migradas: {migrate_history_blobs()}")
+        sys.exit(0)
+    if '--purge-idempotency-keys' in sys.argv:
+        print(f"Claves borradas: {purge_idempotency_keys()}")
+        sys.exit(0)
+    
     port = int(os.environ.get('PORT', 5000))
     app.run(debug=False, host='0.0.0.0', port=port)
\ No newline at end of file
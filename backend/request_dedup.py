@@ -0,0 +1,62 @@
+"""
+Coalescencia de peticiones idénticas en curso (single-flight).
+
+Si llega una petición con la misma clave que otra que todavía se está
+procesando, espera a que termine y reutiliza su resultado en lugar de
+ejecutar el pipeline otra vez.
+"""
+
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats = {'executed': 0, 'coalesced': 0}
+
+    def do(self, key, fn):
+        """
+        Ejecuta fn() una sola vez por clave entre llamadas concurrentes.
+        Retorna (resultado, compartido); si fn() lanza una excepción, todas
+        las llamadas que esperaban la reciben.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._stats['executed'] += 1
+            else:
+                self._stats['coalesced'] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._calls)
+        return stats
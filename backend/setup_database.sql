@@ -13,32 +13,198 @@ USE search_db;
 -- ================================================
 CREATE TABLE IF NOT EXISTS components (
     id INT AUTO_INCREMENT PRIMARY KEY,
-    keyword VARCHAR(255) NOT NULL UNIQUE,
+    keyword VARCHAR(255) NOT NULL,
+    keyword_key VARCHAR(255),  -- Clave normalizada (sin tildes, sin plural, ver normalize_keyword)
+    sector VARCHAR(100) NOT NULL DEFAULT '',   -- Contexto de la búsqueda (normalizado)
+    country VARCHAR(100) NOT NULL DEFAULT '',  -- Contexto de la búsqueda (normalizado)
     campo1 TEXT,           -- Resultado completo en JSON
     campo2 TEXT,           -- Descripción
     campo3 INT,            -- Relevance score
     campo4 TEXT,           -- Campo adicional (por definir)
+    refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,  -- Última vez que se obtuvo de la IA
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-    INDEX idx_keyword (keyword)
+    UNIQUE KEY uq_component_context (keyword, sector, country),
+    INDEX idx_keyword (keyword),
+    INDEX idx_keyword_key (keyword_key, sector, country),
+    INDEX idx_context (sector, country)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
+-- ================================================
+-- Migración: components.keyword_key
+-- Descripción: Agrega la clave normalizada a bases creadas antes de esta
+-- columna. Las filas existentes quedan con keyword_key = NULL y se
+-- rellenan desde el backend con: python main.py --backfill-keys
+-- ================================================
+SET @has_keyword_key := (
+    SELECT COUNT(*) FROM information_schema.COLUMNS
+    WHERE TABLE_SCHEMA = DATABASE()
+      AND TABLE_NAME = 'components'
+      AND COLUMN_NAME = 'keyword_key'
+);
+SET @ddl := IF(@has_keyword_key = 0,
+    'ALTER TABLE components ADD COLUMN keyword_key VARCHAR(255) AFTER keyword, ADD INDEX idx_keyword_key (keyword_key)',
+    'SELECT 1');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- ================================================
+-- Migración: componentes por contexto (keyword, sector, país)
+-- Descripción: El resultado de la IA depende del sector y el país, así que
+-- la unicidad pasa de keyword a (keyword, sector, country). Las filas
+-- existentes quedan con sector = '' y country = '' (sin contexto) y
+-- refreshed_at = created_at.
+-- ================================================
+SET @has_context := (
+    SELECT COUNT(*) FROM information_schema.COLUMNS
+    WHERE TABLE_SCHEMA = DATABASE()
+      AND TABLE_NAME = 'components'
+      AND COLUMN_NAME = 'sector'
+);
+SET @ddl := IF(@has_context = 0,
+    'ALTER TABLE components
+        ADD COLUMN sector VARCHAR(100) NOT NULL DEFAULT '''' AFTER keyword_key,
+        ADD COLUMN country VARCHAR(100) NOT NULL DEFAULT '''' AFTER sector,
+        ADD COLUMN refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP AFTER campo4,
+        DROP INDEX keyword,
+        DROP INDEX idx_keyword_key,
+        ADD UNIQUE KEY uq_component_context (keyword, sector, country),
+        ADD INDEX idx_keyword_key (keyword_key, sector, country),
+        ADD INDEX idx_context (sector, country)',
+    'SELECT 1');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+UPDATE components SET refreshed_at = created_at WHERE @has_context = 0;
+
 -- ================================================
 -- Tabla: search_history
--- Descripción: Almacena el historial de búsquedas realizadas
+-- Descripción: Almacena el historial de búsquedas realizadas; cada fila
+-- pertenece al usuario que hizo la búsqueda (user_id de Supabase)
 -- ================================================
 CREATE TABLE IF NOT EXISTS search_history (
     id INT AUTO_INCREMENT PRIMARY KEY,
+    user_id VARCHAR(36),   -- NULL en las filas guardadas antes de la columna
     company_name VARCHAR(255) NOT NULL,
     country VARCHAR(100),
     sector VARCHAR(100),
     keywords JSON,         -- Array de palabras clave en formato JSON
-    results JSON,          -- Resultados completos en formato JSON
+    results JSON,          -- Respuesta de /search; los payloads van en result_blobs
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     INDEX idx_company (company_name),
     INDEX idx_country (country),
     INDEX idx_sector (sector),
-    INDEX idx_created_at (created_at)
+    INDEX idx_created_at (created_at),
+    INDEX idx_user_created (user_id, created_at, id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- ================================================
+-- Migración: historial por usuario
+-- Descripción: /results y /results/counts solo devuelven las búsquedas del
+-- usuario autenticado. Las filas anteriores quedan con user_id = NULL y no
+-- las ve ningún usuario.
+-- ================================================
+SET @has_user := (
+    SELECT COUNT(*) FROM information_schema.COLUMNS
+    WHERE TABLE_SCHEMA = DATABASE()
+      AND TABLE_NAME = 'search_history'
+      AND COLUMN_NAME = 'user_id'
+);
+SET @ddl := IF(@has_user = 0,
+    'ALTER TABLE search_history
+        ADD COLUMN user_id VARCHAR(36) AFTER id,
+        ADD INDEX idx_user_created (user_id, created_at, id)',
+    'SELECT 1');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- ================================================
+-- Tabla: result_blobs
+-- Descripción: Payloads de las respuestas guardadas en search_history,
+-- almacenados una sola vez por contenido (kind = 'component' | 'analysis').
+-- En search_history.results cada payload se reemplaza por {"$blob": hash},
+-- donde hash es el sha256 del JSON canónico. Las filas guardadas antes de
+-- esta tabla se migran desde el backend con:
+-- python main.py --migrate-history-blobs
+-- ================================================
+CREATE TABLE IF NOT EXISTS result_blobs (
+    hash CHAR(64) NOT NULL PRIMARY KEY,
+    kind VARCHAR(20) NOT NULL,
+    content JSON NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- ================================================
+-- Tabla: search_history_counts
+-- Descripción: Conteos precalculados de búsquedas de cada usuario por
+-- empresa y por sector (dimension = 'company' | 'sector'). El backend los
+-- incrementa en la misma transacción que inserta en search_history. Al
+-- crear la tabla se rellenan a partir del historial existente; la versión
+-- anterior (sin user_id) se descarta y se vuelve a calcular.
+-- ================================================
+SET @counts_without_user := (
+    SELECT COUNT(*) FROM information_schema.TABLES t
+    WHERE t.TABLE_SCHEMA = DATABASE()
+      AND t.TABLE_NAME = 'search_history_counts'
+      AND NOT EXISTS (
+          SELECT 1 FROM information_schema.COLUMNS c
+          WHERE c.TABLE_SCHEMA = t.TABLE_SCHEMA
+            AND c.TABLE_NAME = t.TABLE_NAME
+            AND c.COLUMN_NAME = 'user_id'
+      )
+);
+SET @ddl := IF(@counts_without_user > 0,
+    'DROP TABLE search_history_counts',
+    'SELECT 1');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @has_counts := (
+    SELECT COUNT(*) FROM information_schema.TABLES
+    WHERE TABLE_SCHEMA = DATABASE()
+      AND TABLE_NAME = 'search_history_counts'
+);
+
+CREATE TABLE IF NOT EXISTS search_history_counts (
+    user_id VARCHAR(36) NOT NULL,
+    dimension VARCHAR(20) NOT NULL,
+    value VARCHAR(255) NOT NULL,
+    total INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, dimension, value),
+    INDEX idx_user_dimension_total (user_id, dimension, total)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+INSERT INTO search_history_counts (user_id, dimension, value, total)
+SELECT user_id, 'company', company_name, COUNT(*) FROM search_history
+WHERE @has_counts = 0 AND user_id IS NOT NULL
+GROUP BY user_id, company_name
+ON DUPLICATE KEY UPDATE total = VALUES(total);
+
+INSERT INTO search_history_counts (user_id, dimension, value, total)
+SELECT user_id, 'sector', COALESCE(sector, ''), COUNT(*) FROM search_history
+WHERE @has_counts = 0 AND user_id IS NOT NULL
+GROUP BY user_id, COALESCE(sector, '')
+ON DUPLICATE KEY UPDATE total = VALUES(total);
+
+-- ================================================
+-- Tabla: idempotency_keys
+-- Descripción: Respuestas de /search por Idempotency-Key (clave ya combinada
+-- con el usuario). Una petición reserva la clave (response = NULL) antes de
+-- ejecutar la búsqueda y guarda la respuesta al terminar, así un reintento
+-- que llega a otro worker o instancia no repite la búsqueda. Las claves
+-- vencidas se borran con: python main.py --purge-idempotency-keys
+-- ================================================
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    idempotency_key VARCHAR(100) NOT NULL PRIMARY KEY,
+    fingerprint VARCHAR(100) NOT NULL,  -- Datos normalizados de la búsqueda
+    response JSON,                      -- NULL mientras la búsqueda está en curso
+    expires_at TIMESTAMP NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_expires_at (expires_at)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- ================================================
@@ -46,11 +212,11 @@ CREATE TABLE IF NOT EXISTS search_history (
 -- ================================================
 
 -- Insertar algunos componentes de ejemplo
-INSERT INTO components (keyword, campo1, campo2, campo3) VALUES
-('tecnología', '{"keyword": "tecnología", "description": "Empresas del sector tecnológico", "relevance_score": 85}', 'Empresas del sector tecnológico', 85),
-('innovación', '{"keyword": "innovación", "description": "Empresas innovadoras y disruptivas", "relevance_score": 90}', 'Empresas innovadoras y disruptivas', 90),
-('sostenibilidad', '{"keyword": "sostenibilidad", "description": "Empresas con enfoque sostenible", "relevance_score": 80}', 'Empresas con enfoque sostenible', 80)
-ON DUPLICATE KEY UPDATE updated_at = CURRENT_TIMESTAMP;
+INSERT INTO components (keyword, keyword_key, campo1, campo2, campo3) VALUES
+('tecnología', 'tecnologi', '{"keyword": "tecnología", "description": "Empresas del sector tecnológico", "relevance_score": 85}', 'Empresas del sector tecnológico', 85),
+('innovación', 'innovacion', '{"keyword": "innovación", "description": "Empresas innovadoras y disruptivas", "relevance_score": 90}', 'Empresas innovadoras y disruptivas', 90),
+('sostenibilidad', 'sostenibilidad', '{"keyword": "sostenibilidad", "description": "Empresas con enfoque sostenible", "relevance_score": 80}', 'Empresas con enfoque sostenible', 80)
+ON DUPLICATE KEY UPDATE keyword_key = VALUES(keyword_key), updated_at = CURRENT_TIMESTAMP;
 
 -- ================================================
 -- Verificación
@@ -65,6 +231,15 @@ DESCRIBE components;
 -- Verificar estructura de search_history
 DESCRIBE search_history;
 
+-- Verificar estructura de search_history_counts
+DESCRIBE search_history_counts;
+
+-- Verificar estructura de result_blobs
+DESCRIBE result_blobs;
+
+-- Verificar estructura de idempotency_keys
+DESCRIBE idempotency_keys;
+
 -- Contar registros en components
 SELECT COUNT(*) as total_components FROM components;
 
@@ -81,6 +256,16 @@ INSTRUCCIONES DE USO:
 1. Abrir MySQL Workbench o línea de comandos de MySQL
 2. Ejecutar este script completo
 3. Verificar que las tablas se hayan creado correctamente
+4. Si la BD ya tenía datos, rellenar las claves normalizadas:
+   python main.py --backfill-keys
+   Si cambian las reglas de normalize_keyword (keyword_index.py), recalcular
+   todas las claves:
+   UPDATE components SET keyword_key = NULL;
+   python main.py --backfill-keys
+5. Si search_history ya tenía filas, mover sus payloads a result_blobs y
+   recuperar el espacio liberado:
+   python main.py --migrate-history-blobs
+   OPTIMIZE TABLE search_history;
 
 COMANDOS ÚTILES:
 
@@ -99,6 +284,9 @@ SHOW TABLES;
 -- Limpiar datos de las tablas
 -- TRUNCATE TABLE components;
 -- TRUNCATE TABLE search_history;
+-- TRUNCATE TABLE search_history_counts;
+-- TRUNCATE TABLE result_blobs;
+-- TRUNCATE TABLE idempotency_keys;
 
 CONFIGURACIÓN EN main.py:
 
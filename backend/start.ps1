@@ -22,7 +22,7 @@ if (-Not (Test-Path ".env")) {
 # Verificar dependencias
 Write-Host "📦 Verificando dependencias..." -ForegroundColor Green
 try {
-    python -c "import flask, flask_cors, mysql.connector, openai, decouple"
+    python -c "import flask, flask_cors, mysql.connector, openai"
     Write-Host "✓ Todas las dependencias están instaladas" -ForegroundColor Green
 } catch {
     Write-Host "❌ Faltan dependencias. Instalando..." -ForegroundColor Red
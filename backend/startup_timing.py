@@ -0,0 +1,51 @@
+"""
+Tiempos de arranque por dependencia.
+
+main.py envuelve sus imports y la creación de clientes en timed(); el
+reporte (GET /metrics -> startup, o STARTUP_REPORT=1 al arrancar) muestra
+cuánto aporta cada una al arranque en frío. Las dependencias que se cargan
+de forma diferida aparecen con la fase 'lazy' cuando se usan por primera vez.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+_started = time.perf_counter()
+_timings = []
+_lock = threading.Lock()
+_ready_seconds = None
+
+
+@contextmanager
+def timed(name, phase='import'):
+    """Mide el bloque y lo registra como (nombre, fase, segundos)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        with _lock:
+            _timings.append({'name': name, 'phase': phase, 'seconds': round(elapsed, 4)})
+
+
+def mark_ready():
+    """Marca el fin de la importación del módulo principal"""
+    global _ready_seconds
+    _ready_seconds = round(time.perf_counter() - _started, 4)
+
+
+def report():
+    with _lock:
+        entries = list(_timings)
+    return {
+        'ready_seconds': _ready_seconds,
+        'entries': sorted(entries, key=lambda entry: -entry['seconds']),
+    }
+
+
+def print_report():
+    data = report()
+    print(f"Arranque listo en {data['ready_seconds']}s")
+    for entry in data['entries']:
+        print(f"  {entry['seconds']:>8.4f}s  {entry['phase']:<7} {entry['name']}")
@@ -0,0 +1,58 @@
+-- ================================================
+-- Funciones RPC de Supabase (Postgres)
+-- Proyecto: ProyectHack - Sistema de Búsqueda Empresarial
+--
+-- Ejecutar en el SQL Editor del proyecto de Supabase. Si la función no
+-- existe, el backend vuelve a hacer el insert y el update por separado.
+-- ================================================
+
+-- ================================================
+-- Columna: companies.analysis_key
+-- Descripción: Identidad normalizada del análisis (company_identity en
+-- main.py: empresa, país, sector e input de keywords). /search busca un
+-- análisis reciente reutilizable con una lectura por este índice. Las
+-- empresas creadas antes de la columna quedan con NULL y no se reutilizan.
+-- ================================================
+ALTER TABLE public.companies ADD COLUMN IF NOT EXISTS analysis_key text;
+
+CREATE INDEX IF NOT EXISTS idx_companies_analysis_key
+    ON public.companies (analysis_key, created_at DESC);
+
+-- ================================================
+-- Función: create_company_and_link
+-- Descripción: Crea la empresa analizada y la vincula al perfil del usuario
+-- en una sola transacción (una llamada desde /search en lugar de dos).
+-- Retorna el id de la empresa creada.
+-- ================================================
+-- Versión anterior, sin p_analysis_key
+DROP FUNCTION IF EXISTS public.create_company_and_link(uuid, text, text, text, jsonb, jsonb);
+
+CREATE OR REPLACE FUNCTION public.create_company_and_link(
+    p_user_id uuid,
+    p_name text,
+    p_country text,
+    p_sector text,
+    p_keywords jsonb,
+    p_search_results jsonb,
+    p_analysis_key text DEFAULT NULL
+)
+RETURNS public.companies.id%TYPE
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_company_id public.companies.id%TYPE;
+BEGIN
+    INSERT INTO public.companies (name, country, sector, keywords, search_results, analysis_key)
+    VALUES (p_name, p_country, p_sector, p_keywords, p_search_results, p_analysis_key)
+    RETURNING id INTO v_company_id;
+
+    UPDATE public.user_profiles
+    SET company_id = v_company_id
+    WHERE id = p_user_id;
+
+    RETURN v_company_id;
+END;
+$$;
+
+-- Recargar el esquema de PostgREST para que la función quede disponible
+NOTIFY pgrst, 'reload schema';
@@ -0,0 +1,282 @@
+"""
+Cola write-behind para escrituras que no necesitan bloquear la respuesta.
+
+Las escrituras se encolan en un buffer acotado y un hilo en segundo plano
+las agrupa por tipo, las ejecuta en lotes y reintenta con backoff
+exponencial. Lo que no se pudo escribir al apagar el proceso (o tras
+agotar los reintentos) se guarda en archivos JSONL en spill_dir y se
+vuelve a encolar en el siguiente arranque.
+
+Si al apagar el hilo sigue dentro de un handler pasado shutdown_timeout,
+el lote en curso también se guarda en disco: puede terminar escribiéndose
+dos veces (entrega al menos una vez). spill_dir solo es durable si es un
+volumen que sobrevive al proceso; un /tmp en memoria se pierde con él.
+"""
+
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+
+
+class WriteBehindQueue:
+
+    def __init__(self, name='write-behind', max_size=1000, batch_size=50, flush_interval=0.5,
+                 max_retries=5, backoff_base=0.5, backoff_max=30.0, spill_dir=None,
+                 shutdown_timeout=5.0):
+        self.name = name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.shutdown_timeout = shutdown_timeout
+        self.spill_dir = Path(spill_dir) if spill_dir else None
+
+        self._queue = queue.Queue(maxsize=max_size)
+        # Escrituras encoladas o en curso (para drain)
+        self._unfinished = 0
+        self._idle = threading.Condition()
+        # Lote que el hilo está escribiendo, por tipo (para guardarlo al apagar)
+        self._in_flight = {}
+        self._in_flight_lock = threading.Lock()
+        self._handlers = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'enqueued': 0,
+            'rejected': 0,
+            'written': 0,
+            'batches': 0,
+            'retries': 0,
+            'spilled': 0,
+            'recovered': 0,
+        }
+
+    def register(self, kind, handler):
+        """
+        handler(payloads) recibe una lista de payloads del mismo tipo y
+        debe lanzar una excepción si la escritura falla (para reintentar)
+        """
+        self._handlers[kind] = handler
+
+    def start(self):
+        """Arranca el hilo de escritura y recupera lo que quedó en disco"""
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+            atexit.register(self.shutdown)
+        self._recover_spilled()
+
+    def submit(self, kind, payload):
+        """
+        Encola una escritura. Retorna False si el buffer está lleno, para que
+        el llamador la haga de forma síncrona.
+        """
+        if kind not in self._handlers:
+            raise KeyError(f"Tipo de escritura no registrado: {kind}")
+        self.start()
+        try:
+            self._put((kind, payload, 0))
+        except queue.Full:
+            self._record('rejected')
+            return False
+        self._record('enqueued')
+        return True
+
+    def write(self, kind, payloads):
+        """Ejecuta una escritura de forma síncrona, sin pasar por la cola"""
+        self._handlers[kind](payloads)
+        self._record('written', len(payloads))
+
+    def drain(self, timeout=None):
+        """
+        Espera a que se escriba (o se guarde en disco) todo lo encolado.
+        Retorna False si se agotó el timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while self._unfinished:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['pending'] = self._queue.qsize()
+        stats['running'] = self._thread is not None and self._thread.is_alive()
+        return stats
+
+    def shutdown(self):
+        """Intenta vaciar la cola y guarda en disco lo que no alcanzó a escribirse"""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        leftovers = []
+        if self._thread is not None:
+            self._thread.join(self.shutdown_timeout)
+            if self._thread.is_alive():
+                # El hilo sigue dentro de un handler: su lote se guarda en disco
+                with self._in_flight_lock:
+                    for items in self._in_flight.values():
+                        leftovers.extend(items)
+                    self._in_flight = {}
+
+        while True:
+            try:
+                leftovers.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        self._spill(leftovers)
+
+    # ---------- hilo de escritura ----------
+    def _record(self, key, amount=1):
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def _put(self, item):
+        # Se cuenta antes de encolar para que el hilo no la termine antes de contarla
+        with self._idle:
+            self._unfinished += 1
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self._done(1)
+            raise
+
+    def _done(self, count):
+        with self._idle:
+            self._unfinished -= count
+            if not self._unfinished:
+                self._idle.notify_all()
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            if batch:
+                try:
+                    self._flush(batch)
+                finally:
+                    # Los reintentos ya se volvieron a encolar (y a contar) en _flush
+                    self._done(len(batch))
+            elif self._stop.is_set():
+                return
+
+    def _collect_batch(self):
+        try:
+            first = self._queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch):
+        by_kind = {}
+        for kind, payload, attempts in batch:
+            by_kind.setdefault(kind, []).append((payload, attempts))
+        with self._in_flight_lock:
+            self._in_flight = {
+                kind: [(kind, payload, attempts) for payload, attempts in items]
+                for kind, items in by_kind.items()
+            }
+
+        for kind, items in by_kind.items():
+            payloads = [payload for payload, _ in items]
+            attempts = max(attempts for _, attempts in items)
+            try:
+                self._handlers[kind](payloads)
+                self._release_in_flight(kind)
+                self._record('written', len(payloads))
+                self._record('batches')
+            except Exception as e:
+                print(f"[{self.name}] Error escribiendo {kind} (intento {attempts + 1}): {e}")
+                # Si shutdown ya guardó el lote en disco, no se reintenta
+                if self._release_in_flight(kind):
+                    self._retry(kind, items, attempts + 1)
+
+    def _release_in_flight(self, kind):
+        """Quita un tipo del lote en curso; False si shutdown ya lo tomó"""
+        with self._in_flight_lock:
+            return self._in_flight.pop(kind, None) is not None
+
+    def _retry(self, kind, items, attempts):
+        if attempts > self.max_retries or self._stop.is_set():
+            self._spill([(kind, payload, attempts) for payload, _ in items])
+            return
+
+        delay = min(self.backoff_base * (2 ** (attempts - 1)), self.backoff_max)
+        self._record('retries')
+        # Espera interrumpible: al apagar, lo pendiente va directo a disco
+        if self._stop.wait(delay):
+            self._spill([(kind, payload, attempts) for payload, _ in items])
+            return
+        for payload, _ in items:
+            try:
+                self._put((kind, payload, attempts))
+            except queue.Full:
+                self._spill([(kind, payload, attempts)])
+
+    # ---------- persistencia en disco ----------
+    def _spill(self, items):
+        if not items:
+            return
+        if not self.spill_dir:
+            print(f"[{self.name}] Se descartan {len(items)} escrituras (sin spill_dir)")
+            return
+        try:
+            self.spill_dir.mkdir(parents=True, exist_ok=True)
+            path = self.spill_dir / f"{self.name}-{os.getpid()}-{time.time_ns()}.jsonl"
+            with open(path, 'a', encoding='utf-8') as f:
+                for kind, payload, _ in items:
+                    f.write(json.dumps({'kind': kind, 'payload': payload}, ensure_ascii=False) + '\n')
+            self._record('spilled', len(items))
+            print(f"[{self.name}] {len(items)} escrituras guardadas en {path}")
+        except OSError as e:
+            print(f"[{self.name}] Error guardando escrituras pendientes: {e}")
+
+    def _recover_spilled(self):
+        if not self.spill_dir or not self.spill_dir.exists():
+            return
+        for path in sorted(self.spill_dir.glob(f"{self.name}-*.jsonl")):
+            # El rename es atómico: si hay varios workers, solo uno reclama cada archivo
+            claimed = path.with_suffix(f'.claimed-{os.getpid()}')
+            try:
+                path.rename(claimed)
+            except OSError:
+                continue
+
+            recovered = 0
+            with open(claimed, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if entry.get('kind') not in self._handlers:
+                        continue
+                    try:
+                        self._put((entry['kind'], entry['payload'], 0))
+                        recovered += 1
+                    except queue.Full:
+                        self._spill([(entry['kind'], entry['payload'], 0)])
+            claimed.unlink()
+            self._record('recovered', recovered)
@@ -3,7 +3,7 @@ FastAPI REST API for Company Lookup Service
 Author: Mauricio J. @synaw_w
 """
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Header
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
@@ -11,12 +11,22 @@ import os
 import logging
 import json
 import hashlib
+import hmac
 from functools import lru_cache
 from urllib.parse import urlparse
 from pathlib import Path
 from datetime import datetime, timedelta
 from apify_client import ApifyClient
 
+try:
+    from src.modules.llm_gateway import LLMGateway
+    from src.modules.llm_accounting import LLMAccounting
+    from src.modules import prompt_builder
+except ImportError:
+    from modules.llm_gateway import LLMGateway
+    from modules.llm_accounting import LLMAccounting
+    from modules import prompt_builder
+
 try:
     from dotenv import load_dotenv
     load_dotenv()
@@ -80,6 +90,7 @@ class CompanyLookupResponse(BaseModel):
     agent: Optional[AgentResponse] = None
     results: Dict[str, Any]
     summary: Optional[Dict[str, Any]] = None
+    llm_usage: Optional[Dict[str, Any]] = None
     message: Optional[str] = None
 
 
@@ -92,6 +103,29 @@ class HealthResponse(BaseModel):
 # Global client (lazy initialization)
 _apify_client = None
 
+# All DeepSeek calls in this process go through the gateway (per-minute limits
+# of 0 = unlimited). Limits are per process, not shared across workers/instances
+llm_gateway = LLMGateway(
+    name="deepseek",
+    requests_per_minute=int(os.getenv("LLM_REQUESTS_PER_MINUTE", "120")),
+    tokens_per_minute=int(os.getenv("LLM_TOKENS_PER_MINUTE", "0")),
+    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "5")),
+    max_wait_seconds=float(os.getenv("LLM_MAX_WAIT_SECONDS", "120")),
+    max_retries=int(os.getenv("LLM_MAX_RETRIES", "3"))
+)
+
+# Tokens, latency and estimated cost per DeepSeek call site (USD per million tokens)
+llm_usage = LLMAccounting(
+    name="deepseek",
+    input_price_per_million=float(os.getenv("LLM_PRICE_INPUT_PER_MILLION", "0.28")),
+    cached_input_price_per_million=float(os.getenv("LLM_PRICE_CACHED_INPUT_PER_MILLION", "0.028")),
+    output_price_per_million=float(os.getenv("LLM_PRICE_OUTPUT_PER_MILLION", "0.42"))
+)
+
+# Token budget (local estimate) for the organic titles pasted into the agent prompts
+PROMPT_BUDGET_TITLES = int(os.getenv("PROMPT_BUDGET_TITLES", "300"))
+PROMPT_TITLE_TOKENS = int(os.getenv("PROMPT_TITLE_TOKENS", "24"))
+
 
 def get_client():
     """Get or create Apify client (singleton)."""
@@ -124,7 +158,7 @@ def get_deepseek_llm(language: str = "es"):
             temperature=0,
             max_tokens=None,
             timeout=None,
-            max_retries=2
+            max_retries=0  # 429s are retried by llm_gateway
         )
         logger.info("DeepSeek LLM initialized successfully")
         return llm
@@ -133,6 +167,27 @@ def get_deepseek_llm(language: str = "es"):
         return None
 
 
+def invoke_llm(llm, prompt_text: str, call_site: str):
+    """
+    Invoke the LLM through the process-wide gateway (rate, concurrency and backoff).
+    Tokens, latency (including gateway wait) and cost are recorded under call_site.
+    """
+    prompt_tokens = prompt_builder.record(call_site, prompt_text)
+    return llm_usage.track(
+        call_site,
+        llm_gateway.call,
+        llm.invoke,
+        prompt_text,
+        estimated_tokens=prompt_tokens + 500
+    )
+
+
+def format_organic_titles(organic_titles: List[str]) -> str:
+    """Deduplicated, trimmed organic titles that fit PROMPT_BUDGET_TITLES, one per line."""
+    titles = prompt_builder.compact_titles(organic_titles, PROMPT_BUDGET_TITLES, PROMPT_TITLE_TOKENS)
+    return "\n".join(f"- {title}" for title in titles)
+
+
 def get_company_info_and_keywords_agent(company_name: str, language: str = "es", country_code: Optional[str] = None, organic_titles: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
     """
     Agent combinado: Obtener información de la empresa Y generar keywords en una sola llamada.
@@ -162,7 +217,7 @@ def get_company_info_and_keywords_agent(company_name: str, language: str = "es",
         
         organic_context = ""
         if organic_titles:
-            titles_text = "\n".join([f"- {title}" for title in organic_titles[:20]])  # Limitar a 20 títulos
+            titles_text = format_organic_titles(organic_titles)
             organic_context = f"\n\nREFERENCIAS DE BÚSQUEDA (títulos de resultados orgánicos encontrados sobre esta empresa):\n{titles_text}\n\nUsa estos títulos como referencia para entender mejor qué hace la empresa, sus productos, servicios y actividades. Estos resultados provienen de búsquedas reales en Google."
         
         prompt_text = f"""Eres un experto en investigación de empresas y marketing digital. Analiza la empresa "{company_name}" y proporciona:
@@ -190,7 +245,7 @@ Ejemplo de keywords INCORRECTAS: ["rokys", "comida rokys", "restaurante rokys"]
 
 Responde SOLO con el JSON, sin texto adicional."""
         
-        response = llm.invoke(prompt_text)
+        response = invoke_llm(llm, prompt_text, call_site="get_company_info_and_keywords_agent")
         content = response.content.strip()
         
         logger.debug(f"Raw agent response: {content[:200]}...")
@@ -264,7 +319,7 @@ def get_keywords_agent(company_name: str, company_info: Optional[Dict[str, Any]]
         
         organic_context = ""
         if organic_titles:
-            titles_text = "\n".join([f"- {title}" for title in organic_titles[:20]])  # Limitar a 20 títulos
+            titles_text = format_organic_titles(organic_titles)
             organic_context = f"\n\nREFERENCIAS DE BÚSQUEDA (títulos de resultados orgánicos encontrados sobre esta empresa):\n{titles_text}\n\nUsa estos títulos para identificar palabras clave relevantes que las personas realmente buscan relacionadas con esta empresa. Extrae términos importantes de estos títulos y genera keywords basadas en ellos."
         
         prompt_text = f"""Eres un experto en marketing digital y SEO. Para la empresa "{company_name}"{info_context}{country_context}{organic_context}, genera una lista de palabras clave relevantes.
@@ -287,7 +342,7 @@ Genera entre 5 y 10 palabras clave. Responde SOLO con un array JSON de strings,
 Ejemplo CORRECTO: ["comida criolla peruana", "restaurante familiar lima", "pollo a la brasa", "ceviche", "anticuchos", "lomo saltado", "restaurante tradicional peruano"]
 Ejemplo INCORRECTO: ["rokys", "comida rokys", "restaurante rokys", "rokys lima", "rokys carta"]"""
         
-        response = llm.invoke(prompt_text)
+        response = invoke_llm(llm, prompt_text, call_site="get_keywords_agent")
         content = response.content.strip()
         
         if content.startswith("```json"):
@@ -510,7 +565,7 @@ Determina cuál es el dominio PRINCIPAL y OFICIAL de la empresa. Este debe ser:
 
 Responde SOLO con el dominio (ej: "rokys.com"), sin "https://", sin "http://", sin "www.", sin texto adicional."""
         
-        response = llm.invoke(prompt_text)
+        response = invoke_llm(llm, prompt_text, call_site="get_domain_agent")
         content = response.content.strip()
         
         # Clean up the response
@@ -847,6 +902,7 @@ def get_agent_response(company_name: str, language_code: Optional[str] = None, c
         logger.info(f"   Keywords count: {len(cached_response.keywords)}")
         logger.info(f"   Domain: {cached_response.domain}")
         logger.info(f"   Logo URL: {cached_response.logo_url}")
+        llm_usage.record_cache_hit("get_agent_response")
         return cached_response
     
     logger.warning(f"❌❌❌ CACHE MISS - Will make API calls to DeepSeek (this will consume credits)")
@@ -1080,6 +1136,7 @@ async def root():
         "endpoints": {
             "POST /lookup/company": "Buscar información de una empresa",
             "GET /health": "Health check",
+            "GET /metrics": "Métricas de las llamadas a DeepSeek",
             "GET /docs": "Documentación interactiva (Swagger UI)",
             "GET /redoc": "Documentación alternativa (ReDoc)"
         }
@@ -1102,8 +1159,30 @@ async def health_check():
         raise HTTPException(status_code=503, detail=f"Service unhealthy: {str(e)}")
 
 
+# /metrics exposes spend and gateway state: it requires
+# "Authorization: Bearer <METRICS_TOKEN>" and is disabled when no token is set
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+
+@app.get("/metrics")
+async def metrics(authorization: Optional[str] = Header(None)):
+    """DeepSeek gateway, per-call-site usage (tokens, latency, cost, cache hits) and prompt sizes."""
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    if not hmac.compare_digest((authorization or "").encode("utf-8"), f"Bearer {METRICS_TOKEN}".encode("utf-8")):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return {
+        "llm_gateway": llm_gateway.stats(),
+        "llm_usage": llm_usage.stats(),
+        "prompts": prompt_builder.stats()
+    }
+
+
+# The lookup handlers are plain `def`: FastAPI runs them in its threadpool, so the
+# blocking Apify and DeepSeek calls (and the gateway's waits) never stall the
+# event loop, and concurrent lookups actually reach the gateway's limits and queue.
 @app.post("/lookup/company", response_model=CompanyLookupResponse)
-async def lookup_company_endpoint(
+def lookup_company_endpoint(
     request: CompanyLookupRequest,
     background_tasks: BackgroundTasks
 ):
@@ -1155,19 +1234,23 @@ async def lookup_company_endpoint(
             logger.warning("⚠️ DEEPSEEK_API is not set! Configure it in GitHub Secrets or Cloud Run environment variables.")
         
         agent_response = None
+        request_llm_usage = None
         if not LANGCHAIN_AVAILABLE:
             logger.error("❌ LangChain is not available. Check Dockerfile build logs for installation errors.")
         elif not deepseek_key:
             logger.error("❌ DEEPSEEK_API is not configured. Add it to GitHub Secrets: DEEPSEEK_API")
         else:
             try:
-                agent_response = get_agent_response(
-                    request.company, 
-                    request.language_code, 
-                    request.country_code,
-                    organic_titles,
-                    organic_urls
-                )
+                with llm_usage.request_scope() as usage:
+                    agent_response = get_agent_response(
+                        request.company, 
+                        request.language_code, 
+                        request.country_code,
+                        organic_titles,
+                        organic_urls
+                    )
+                request_llm_usage = usage.summary()
+                logger.info(f"LLM usage for {request.company}: {usage.describe()}")
                 if agent_response:
                     logger.info(f"✅ Agent response generated successfully: {agent_response.company_name}")
                 else:
@@ -1183,7 +1266,8 @@ async def lookup_company_endpoint(
             keywords=results.get("keywords", request.keywords or []),
             agent=agent_response,
             results=results,
-            summary=summary
+            summary=summary,
+            llm_usage=request_llm_usage
         )
     except ValueError as e:
         logger.error(f"Validation error: {e}")
@@ -1210,7 +1294,7 @@ async def lookup_company_endpoint(
 
 
 @app.get("/lookup/company/{company_name}", response_model=CompanyLookupResponse)
-async def lookup_company_get(
+def lookup_company_get(
     company_name: str,
     keywords: Optional[str] = None,
     max_items: int = 50,
@@ -1247,7 +1331,7 @@ async def lookup_company_get(
     )
     
     # Use POST endpoint logic
-    return await lookup_company_endpoint(request, BackgroundTasks())
+    return lookup_company_endpoint(request, BackgroundTasks())
 
 
 @app.exception_handler(Exception)
@@ -0,0 +1,216 @@
+"""
+Contabilidad de las llamadas al LLM (DeepSeek).
+
+Cada llamada se registra con su punto de origen (call site): tokens de
+prompt y de respuesta, tokens de prompt servidos por la caché de contexto
+del proveedor, latencia, errores y costo estimado. Los aciertos de las
+cachés propias (respuestas ya guardadas) se registran aparte, así se ve
+cuántas llamadas se evitaron.
+
+Hay dos vistas:
+- stats(): acumulado del proceso por call site (para /metrics)
+- request_scope(): resumen de las llamadas hechas dentro de un bloque
+  (una petición). Se propaga con contextvars; para las tareas enviadas a
+  otro hilo hay que envolver la función con bind().
+
+Solo usa la librería estándar. Hay una copia idéntica en
+hackathon/src/modules/llm_accounting.py porque los dos servicios se
+construyen por separado; los cambios deben hacerse en ambas.
+"""
+
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+def usage_breakdown(result):
+    """
+    (prompt_tokens, completion_tokens, cached_prompt_tokens) de una respuesta
+    de OpenAI/DeepSeek o de un mensaje de LangChain; None si no los informa
+    """
+    usage = getattr(result, 'usage', None)
+    if usage is not None and getattr(usage, 'prompt_tokens', None) is not None:
+        # DeepSeek informa prompt_cache_hit_tokens; OpenAI, prompt_tokens_details
+        cached = getattr(usage, 'prompt_cache_hit_tokens', None)
+        if cached is None:
+            cached = getattr(getattr(usage, 'prompt_tokens_details', None), 'cached_tokens', None)
+        return usage.prompt_tokens, usage.completion_tokens or 0, cached or 0
+
+    metadata = getattr(result, 'usage_metadata', None)
+    if isinstance(metadata, dict) and metadata.get('input_tokens') is not None:
+        cached = (metadata.get('input_token_details') or {}).get('cache_read')
+        if cached is None:
+            token_usage = (getattr(result, 'response_metadata', None) or {}).get('token_usage') or {}
+            cached = token_usage.get('prompt_cache_hit_tokens')
+        return metadata['input_tokens'], metadata.get('output_tokens') or 0, cached or 0
+    return None
+
+
+def _empty_totals():
+    return {
+        'calls': 0,
+        'errors': 0,
+        'cache_hits': 0,
+        'prompt_tokens': 0,
+        'completion_tokens': 0,
+        'cached_prompt_tokens': 0,
+        'cost_usd': 0.0,
+        'seconds': 0.0,
+    }
+
+
+def _add(totals, entry):
+    for key in ('calls', 'errors', 'cache_hits', 'prompt_tokens', 'completion_tokens',
+                'cached_prompt_tokens', 'cost_usd', 'seconds'):
+        totals[key] += entry.get(key, 0)
+
+
+def _rounded(totals):
+    totals = dict(totals)
+    totals['cost_usd'] = round(totals['cost_usd'], 6)
+    totals['seconds'] = round(totals['seconds'], 3)
+    return totals
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class RequestUsage:
+    """Llamadas al LLM hechas dentro de un request_scope()"""
+
+    def __init__(self, label=None):
+        self.label = label
+        self._lock = threading.Lock()
+        self._by_call_site = {}
+
+    def add(self, call_site, entry):
+        with self._lock:
+            _add(self._by_call_site.setdefault(call_site, _empty_totals()), entry)
+
+    def summary(self):
+        """Totales de la petición y desglose por call site"""
+        with self._lock:
+            by_call_site = {site: _rounded(totals) for site, totals in self._by_call_site.items()}
+        totals = _empty_totals()
+        for entry in by_call_site.values():
+            _add(totals, entry)
+        summary = _rounded(totals)
+        summary['by_call_site'] = by_call_site
+        return summary
+
+    def describe(self):
+        """Resumen en una línea, con los call sites ordenados por tiempo"""
+        summary = self.summary()
+        sites = sorted(summary['by_call_site'].items(), key=lambda item: -item[1]['seconds'])
+        detail = ', '.join(f"{site} {totals['seconds']}s" for site, totals in sites if totals['calls'])
+        return (
+            f"{summary['calls']} llamadas, {summary['cache_hits']} desde caché, "
+            f"{summary['prompt_tokens']}+{summary['completion_tokens']} tokens, "
+            f"${summary['cost_usd']:.6f}, {summary['seconds']}s" + (f" ({detail})" if detail else '')
+        )
+
+
+class LLMAccounting:
+
+    def __init__(self, name='llm', input_price_per_million=0.0, cached_input_price_per_million=0.0,
+                 output_price_per_million=0.0, latency_window=200):
+        self.name = name
+        self.input_price_per_million = input_price_per_million
+        self.cached_input_price_per_million = cached_input_price_per_million
+        self.output_price_per_million = output_price_per_million
+        self.latency_window = latency_window
+
+        self._lock = threading.Lock()
+        self._by_call_site = {}
+        self._latencies = {}
+        self._current = contextvars.ContextVar(f'{name}_request_usage', default=None)
+
+    def cost(self, prompt_tokens, completion_tokens, cached_prompt_tokens=0):
+        """Costo estimado en USD según los precios por millón de tokens"""
+        uncached = max(0, prompt_tokens - cached_prompt_tokens)
+        return (
+            uncached * self.input_price_per_million
+            + cached_prompt_tokens * self.cached_input_price_per_million
+            + completion_tokens * self.output_price_per_million
+        ) / 1_000_000
+
+    def track(self, call_site, fn, *args, **kwargs):
+        """Ejecuta fn(*args, **kwargs) y registra tokens, latencia y costo"""
+        started = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self._record(call_site, {'calls': 1, 'errors': 1, 'seconds': time.perf_counter() - started})
+            raise
+
+        entry = {'calls': 1, 'seconds': time.perf_counter() - started}
+        usage = usage_breakdown(result)
+        if usage is not None:
+            prompt_tokens, completion_tokens, cached_prompt_tokens = usage
+            entry.update({
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'cached_prompt_tokens': cached_prompt_tokens,
+                'cost_usd': self.cost(prompt_tokens, completion_tokens, cached_prompt_tokens),
+            })
+        self._record(call_site, entry)
+        return result
+
+    def record_cache_hit(self, call_site):
+        """Respuesta servida desde una caché propia: no hubo llamada"""
+        self._record(call_site, {'cache_hits': 1})
+
+    @contextmanager
+    def request_scope(self, label=None):
+        """Acumula en un RequestUsage las llamadas hechas dentro del bloque"""
+        usage = RequestUsage(label)
+        token = self._current.set(usage)
+        try:
+            yield usage
+        finally:
+            self._current.reset(token)
+
+    def bind(self, fn):
+        """Envuelve fn para que, ejecutada en otro hilo, registre en la petición actual"""
+        context = contextvars.copy_context()
+
+        def bound(*args, **kwargs):
+            return context.run(fn, *args, **kwargs)
+        return bound
+
+    def stats(self):
+        with self._lock:
+            by_call_site = {}
+            for site, totals in self._by_call_site.items():
+                entry = _rounded(totals)
+                latencies = self._latencies.get(site)
+                if latencies:
+                    entry['avg_seconds'] = round(totals['seconds'] / max(1, totals['calls']), 3)
+                    entry['p50_seconds'] = round(_percentile(latencies, 0.5), 3)
+                    entry['p95_seconds'] = round(_percentile(latencies, 0.95), 3)
+                    entry['max_seconds'] = round(max(latencies), 3)
+                by_call_site[site] = entry
+        totals = _empty_totals()
+        for entry in by_call_site.values():
+            _add(totals, entry)
+        stats = _rounded(totals)
+        stats['prices_per_million'] = {
+            'input': self.input_price_per_million,
+            'cached_input': self.cached_input_price_per_million,
+            'output': self.output_price_per_million,
+        }
+        stats['by_call_site'] = by_call_site
+        return stats
+
+    def _record(self, call_site, entry):
+        with self._lock:
+            _add(self._by_call_site.setdefault(call_site, _empty_totals()), entry)
+            if entry.get('calls'):
+                self._latencies.setdefault(call_site, deque(maxlen=self.latency_window)).append(entry['seconds'])
+        usage = self._current.get()
+        if usage is not None:
+            usage.add(call_site, entry)
@@ -0,0 +1,263 @@
+"""
+Gateway para las llamadas al LLM (DeepSeek).
+
+Todas las llamadas pasan por un mismo punto que:
+- limita peticiones y tokens por minuto con token buckets
+- acota cuántas llamadas hay en curso a la vez
+- atiende primero las llamadas interactivas y después las de fondo
+- ante un 429 pausa las llamadas (respetando Retry-After), reduce el ritmo
+  a la mitad y lo recupera poco a poco con cada llamada exitosa
+
+Así una ráfaga espera en la cola del gateway en lugar de fallar y
+reintentarse contra la API.
+
+El estado vive en memoria, así que los límites son por proceso: con varios
+workers o instancias, cada uno debe recibir su parte del límite de la cuenta.
+
+Solo usa la librería estándar. Hay una copia idéntica en
+hackathon/src/modules/llm_gateway.py porque los dos servicios se
+construyen por separado; los cambios deben hacerse en ambas.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+
+class GatewayTimeoutError(Exception):
+    """La llamada esperó en la cola más de max_wait_seconds"""
+
+
+def estimate_tokens(*texts):
+    """Estimación rápida de tokens (~4 caracteres por token)"""
+    return sum(len(text or '') for text in texts) // 4 + 1
+
+
+def total_tokens(result):
+    """Tokens reales de una respuesta de OpenAI o de LangChain, si los informa"""
+    usage = getattr(result, 'usage', None)
+    if usage is not None and getattr(usage, 'total_tokens', None) is not None:
+        return usage.total_tokens
+    metadata = getattr(result, 'usage_metadata', None)
+    if isinstance(metadata, dict) and metadata.get('total_tokens') is not None:
+        return metadata['total_tokens']
+    return None
+
+
+def is_rate_limit_error(error):
+    status = getattr(error, 'status_code', None) or getattr(getattr(error, 'response', None), 'status_code', None)
+    return status == 429 or type(error).__name__ == 'RateLimitError'
+
+
+def retry_after_seconds(error):
+    """Valor de la cabecera Retry-After de un 429, si viene"""
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        return float(headers.get('retry-after') or headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+class _TokenBucket:
+    """Bucket que se rellena a `rate` unidades por segundo hasta `capacity`"""
+
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def refill(self, now, rate_factor):
+        rate = self.per_minute * rate_factor / 60.0
+        self.level = min(self.capacity, self.level + (now - self.updated) * rate)
+        self.updated = now
+
+    def wait_for(self, amount, rate_factor):
+        """Segundos hasta que haya `amount` unidades (0 si ya hay)"""
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / (self.per_minute * rate_factor / 60.0)
+
+
+class LLMGateway:
+
+    def __init__(self, name='llm', requests_per_minute=60, tokens_per_minute=0, max_concurrency=5,
+                 max_wait_seconds=120.0, max_retries=3, backoff_base=1.0, backoff_max=60.0,
+                 min_rate_factor=0.1, recovery_step=0.05):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_wait_seconds = max_wait_seconds
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.min_rate_factor = min_rate_factor
+        self.recovery_step = recovery_step
+
+        # Un límite en 0 significa "sin límite"
+        self._requests = _TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self._tokens = _TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self._rate_factor = 1.0
+        self._paused_until = 0.0
+        self._consecutive_limits = 0
+
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._active = 0
+        self._local = threading.local()
+        self._stats = {
+            'calls': 0,
+            'errors': 0,
+            'rate_limited': 0,
+            'retries': 0,
+            'timeouts': 0,
+            'tokens': 0,
+            'wait_seconds': 0.0,
+        }
+
+    @contextmanager
+    def priority(self, priority):
+        """Prioridad por defecto de las llamadas hechas desde este hilo"""
+        previous = getattr(self._local, 'priority', INTERACTIVE)
+        self._local.priority = priority
+        try:
+            yield
+        finally:
+            self._local.priority = previous
+
+    def call(self, fn, *args, priority=None, estimated_tokens=0, **kwargs):
+        """
+        Ejecuta fn(*args, **kwargs) respetando los límites del gateway.
+        Reintenta los 429 con backoff; el resto de errores se propagan.
+        """
+        if priority is None:
+            priority = getattr(self._local, 'priority', INTERACTIVE)
+
+        attempt = 0
+        while True:
+            self._acquire(priority, estimated_tokens)
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                self._release()
+                if not is_rate_limit_error(e):
+                    self._record('errors')
+                    raise
+                self._on_rate_limit(e)
+                attempt += 1
+                if attempt > self.max_retries:
+                    self._record('errors')
+                    raise
+                self._record('retries')
+                continue
+
+            self._release(True, estimated_tokens, total_tokens(result))
+            return result
+
+    def reset(self):
+        """
+        Vuelve al estado inicial: buckets llenos, sin pausa ni reducción de
+        ritmo y contadores en cero. No debe haber llamadas en curso
+        """
+        with self._cond:
+            now = time.monotonic()
+            for bucket in (self._requests, self._tokens):
+                if bucket is not None:
+                    bucket.level = bucket.capacity
+                    bucket.updated = now
+            self._rate_factor = 1.0
+            self._paused_until = 0.0
+            self._consecutive_limits = 0
+            for key in self._stats:
+                self._stats[key] = 0
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats['wait_seconds'] = round(stats['wait_seconds'], 3)
+            stats['active'] = self._active
+            stats['queued'] = len(self._waiting)
+            stats['queued_background'] = sum(1 for p, _ in self._waiting if p == BACKGROUND)
+            stats['rate_factor'] = round(self._rate_factor, 3)
+            stats['paused_for'] = round(max(0.0, self._paused_until - time.monotonic()), 3)
+        return stats
+
+    # ---------- cola y límites ----------
+    def _record(self, key, amount=1):
+        with self._cond:
+            self._stats[key] += amount
+
+    def _seconds_until_ready(self, now, estimated_tokens):
+        """None si hay que esperar a que termine otra llamada; si no, segundos"""
+        if self._active >= self.max_concurrency:
+            return None
+        wait = max(0.0, self._paused_until - now)
+        for bucket, amount in ((self._requests, 1), (self._tokens, estimated_tokens)):
+            if bucket is not None:
+                bucket.refill(now, self._rate_factor)
+                wait = max(wait, bucket.wait_for(amount, self._rate_factor))
+        return wait
+
+    def _acquire(self, priority, estimated_tokens):
+        started = time.monotonic()
+        deadline = started + self.max_wait_seconds
+        with self._cond:
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    # Solo la llamada al frente de la cola (por prioridad) puede pasar
+                    wait = self._seconds_until_ready(now, estimated_tokens) if self._waiting[0] == ticket else None
+                    if wait == 0.0:
+                        break
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise GatewayTimeoutError(f"{self.name}: sin capacidad tras {self.max_wait_seconds}s en cola")
+                    self._cond.wait(remaining if wait is None else min(wait, remaining))
+
+                if self._requests is not None:
+                    self._requests.level -= 1
+                if self._tokens is not None:
+                    self._tokens.level -= estimated_tokens
+                self._active += 1
+                self._stats['calls'] += 1
+                self._stats['wait_seconds'] += time.monotonic() - started
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+
+    def _release(self, succeeded=False, estimated_tokens=0, actual_tokens=None):
+        with self._cond:
+            self._active -= 1
+            if succeeded:
+                self._consecutive_limits = 0
+                # Recuperación gradual del ritmo después de un 429
+                self._rate_factor = min(1.0, self._rate_factor + self.recovery_step)
+                if actual_tokens is not None:
+                    self._stats['tokens'] += actual_tokens
+                    # Se corrige lo descontado por la estimación con el uso real
+                    if self._tokens is not None:
+                        self._tokens.level -= actual_tokens - estimated_tokens
+            self._cond.notify_all()
+
+    def _on_rate_limit(self, error):
+        """429: pausa a todos y reduce el ritmo a la mitad"""
+        with self._cond:
+            self._stats['rate_limited'] += 1
+            self._consecutive_limits += 1
+            delay = retry_after_seconds(error)
+            if delay is None:
+                delay = min(self.backoff_base * (2 ** (self._consecutive_limits - 1)), self.backoff_max)
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            self._rate_factor = max(self.min_rate_factor, self._rate_factor / 2)
+            self._cond.notify_all()
@@ -0,0 +1,119 @@
+"""
+Compactación de los datos que se insertan en los prompts del LLM.
+
+Las partes variables de un prompt (resultados de keywords, títulos de
+búsqueda, input del usuario) se compactan y se recortan a un presupuesto
+de tokens por etapa:
+- JSON minificado y sin campos redundantes
+- títulos normalizados, sin duplicados y recortados
+- se conservan los primeros elementos que caben en el presupuesto
+
+Los tokens se estiman localmente (count_tokens), sin llamar a la API.
+record()/stats() registran el tamaño de los prompts de cada etapa.
+
+Solo usa la librería estándar. Hay una copia idéntica en
+hackathon/src/modules/prompt_builder.py porque los dos servicios se
+construyen por separado; los cambios deben hacerse en ambas.
+"""
+
+import json
+import re
+import threading
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]|\n")
+_SPACES_RE = re.compile(r"\s+")
+_PUNCTUATION_RE = re.compile(r"[^\w\s]")
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def count_tokens(text):
+    """
+    Estimación local de tokens: las palabras cuentan un token cada ~4
+    caracteres y cada signo de puntuación o salto de línea cuenta uno
+    """
+    tokens = 0
+    for piece in _TOKEN_RE.findall(text or ''):
+        tokens += (len(piece) + 3) // 4
+    return tokens
+
+
+def compact_json(value):
+    """JSON sin espacios ni sangría"""
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+def clip_text(text, max_tokens):
+    """Recorta text (con espacios normalizados) a max_tokens, en un límite de palabra"""
+    text = _SPACES_RE.sub(' ', text or '').strip()
+    if count_tokens(text) <= max_tokens:
+        return text
+    used = 0
+    end = 0
+    for match in _TOKEN_RE.finditer(text):
+        used += (len(match.group()) + 3) // 4
+        if used > max_tokens - 1:  # un token para la elipsis
+            break
+        end = match.end()
+    return text[:end].rstrip() + '…'
+
+
+def compact_titles(titles, max_tokens, max_title_tokens=24):
+    """
+    Títulos sin duplicados (ignorando mayúsculas, espacios y puntuación),
+    cada uno recortado a max_title_tokens, hasta llenar max_tokens.
+    Cada título se cuenta con su prefijo "- " y el salto de línea
+    """
+    selected = []
+    seen = set()
+    used = 0
+    for title in titles or []:
+        key = _SPACES_RE.sub(' ', _PUNCTUATION_RE.sub(' ', str(title).casefold())).strip()
+        if not key or key in seen:
+            continue
+        title = clip_text(str(title), max_title_tokens)
+        cost = count_tokens(title) + 2
+        if used + cost > max_tokens:
+            break
+        seen.add(key)
+        selected.append(title)
+        used += cost
+    return selected
+
+
+def fit_json_items(items, max_tokens):
+    """
+    Mayor prefijo de items cuyo JSON compacto cabe en max_tokens.
+    Retorna (lista, cantidad de elementos omitidos)
+    """
+    kept = []
+    used = 2  # corchetes
+    for item in items:
+        cost = count_tokens(compact_json(item)) + 1
+        if used + cost > max_tokens:
+            break
+        kept.append(item)
+        used += cost
+    return kept, len(items) - len(kept)
+
+
+def record(stage, prompt):
+    """Registra el tamaño del prompt de una etapa; retorna sus tokens estimados"""
+    tokens = count_tokens(prompt)
+    with _stats_lock:
+        stage_stats = _stats.setdefault(stage, {'prompts': 0, 'tokens': 0, 'max_tokens': 0})
+        stage_stats['prompts'] += 1
+        stage_stats['tokens'] += tokens
+        stage_stats['max_tokens'] = max(stage_stats['max_tokens'], tokens)
+    return tokens
+
+
+def stats():
+    with _stats_lock:
+        result = {}
+        for stage, stage_stats in _stats.items():
+            entry = dict(stage_stats)
+            entry['avg_tokens'] = round(entry['tokens'] / entry['prompts'], 1)
+            result[stage] = entry
+    return result